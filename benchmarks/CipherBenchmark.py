@@ -0,0 +1,90 @@
+"""AEAD cost per packet with a cipher context built on every call against the cached one, and event loop stall of
+decrypting and gunzipping 60 KB payloads inline against in a thread.
+
+Run from the repository root: python -m benchmarks.CipherBenchmark
+"""
+import asyncio
+import gzip
+import os
+import time
+from collections.abc import Callable
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+
+from shared.Helpers import Helpers
+
+KEY = os.urandom(32)
+HEADER = b"tz\x06\x00\x00\x00"
+SIZES = (64, 1024, 60 * 1024)
+ITERATIONS = 20_000
+CONCURRENT = 64
+
+
+def perCall(cipherType: type, msg: bytes) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        iv = os.urandom(12)
+        cipherType(KEY).decrypt(iv, cipherType(KEY).encrypt(iv, msg, HEADER), HEADER)
+    return (time.perf_counter() - start) / ITERATIONS
+
+
+def cached(encrypt: Callable[[bytes, bytes, bytes], bytes], decrypt: Callable[[bytes, bytes, bytes], bytes], msg: bytes) -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        decrypt(encrypt(msg, KEY, HEADER), KEY, HEADER)
+    return (time.perf_counter() - start) / ITERATIONS
+
+
+def unwrap(packet: bytes) -> bytes:
+    return gzip.decompress(Helpers.AESDecrypt(packet, KEY, HEADER))
+
+
+async def loopStall(packets: list[bytes], *, offload: bool) -> tuple[float, float]:
+    """Wall time for all packets and the longest gap between ticks of a 1 ms timer meanwhile."""
+    longest = 0.0
+    done = asyncio.Event()
+
+    async def ticker() -> None:
+        nonlocal longest
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            longest, last = max(longest, now - last), now
+
+    async def handle(packet: bytes) -> None:
+        if offload:
+            await asyncio.to_thread(unwrap, packet)
+        else:
+            unwrap(packet)
+            await asyncio.sleep(0)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(packet) for packet in packets))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await tick
+    return elapsed, longest
+
+
+def main() -> None:
+    for size in SIZES:
+        msg = os.urandom(size)
+        for name, cipherType, encrypt, decrypt in (("AES-256-GCM", AESGCM, Helpers.AESEncrypt, Helpers.AESDecrypt),
+                                                   ("ChaCha20-Poly1305", ChaCha20Poly1305, Helpers.ChaCha20Encrypt, Helpers.ChaCha20Decrypt)):
+            uncached, reused = perCall(cipherType, msg), cached(encrypt, decrypt, msg)
+            print(f"{name:<18} {size:>6} B: per call {uncached * 1e6:>7.2f} us, cached {reused * 1e6:>7.2f} us ({uncached / reused:.2f}x)")
+
+    # Compressible like real JSON bodies, but not so much that gunzip is free
+    body = b"".join(os.urandom(8).hex().encode() + b", " for _ in range(60 * 1024 // 18))
+    packets = [Helpers.AESEncrypt(gzip.compress(body), KEY, HEADER) for _ in range(CONCURRENT)]
+    for offload in (False, True):
+        elapsed, longest = asyncio.run(loopStall(packets, offload=offload))
+        mode = "in a thread" if offload else "inline"
+        print(f"{CONCURRENT} x 60 KB gunzip+decrypt {mode:<11}: {elapsed * 1e3:>6.1f} ms total, longest loop stall {longest * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
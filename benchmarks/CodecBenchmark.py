@@ -0,0 +1,50 @@
+"""Per-request codec cost for MsgPack clients, the old JSON round-trip vs the codec layer.
+
+Run from the repository root: python -m benchmarks.CodecBenchmark
+"""
+import json
+import timeit
+
+import msgpack
+
+from server.protocol.APIPayload import PacketFlags
+from server.protocol.Codec import codecFor
+from server.protocol.Response import Response
+
+ITERATIONS = 200_000
+
+REQUEST = msgpack.packb({"apiKey": "a" * 44, "data": {"uuid": "069a79f4-44e9-4726-a5be-fca90e38aaf5"}})
+RESPONSE = Response(200, "Europe/Prague")
+
+
+def legacyRoundTrip() -> bytes:
+    # Helpers.msgpackToJson followed by json.loads in processRequest
+    request = json.loads(json.dumps(msgpack.unpackb(REQUEST, raw=False)).encode().decode("utf-8", errors="ignore"))
+    request.pop("data", {})
+
+    # json.dumps in sendResponse followed by Helpers.jsonToMsgpack in Client._applyFlags
+    body = json.dumps(RESPONSE.toDict()).encode()
+    return msgpack.packb(json.loads(body.decode()))
+
+
+def codecRoundTrip() -> bytes:
+    codec = codecFor(PacketFlags.MSGPACK)
+    request = codec.decode(REQUEST)
+    request.pop("data", {})
+
+    return RESPONSE.encode(PacketFlags.MSGPACK)
+
+
+def main() -> None:
+    if legacyRoundTrip() != codecRoundTrip():
+        raise RuntimeError("The codec response differs from the legacy one")
+
+    results = {name: timeit.timeit(func, number=ITERATIONS) for name, func in (("legacy", legacyRoundTrip), ("codec", codecRoundTrip))}
+    for name, seconds in results.items():
+        print(f"{name:>8}: {seconds / ITERATIONS * 1e6:.2f} us/request")
+
+    print(f" savings: {(results["legacy"] - results["codec"]) / ITERATIONS * 1e6:.2f} us/request ({results["legacy"] / results["codec"]:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
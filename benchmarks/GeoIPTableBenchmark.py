@@ -0,0 +1,75 @@
+"""GeoIP lookup latency of the flattened range table against geoip2's Reader.city on a GeoLite2 City database.
+
+Run from the repository root: python -m benchmarks.GeoIPTableBenchmark [path/to/GeoLite2-City.mmdb]
+Defaults to the database the bot downloads to state/.
+"""
+import ipaddress
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import geoip2.database
+import geoip2.errors
+import maxminddb
+
+from shared.GeoIPTable import GeoIPTable
+
+DEFAULT_DB_FILE = Path("state/GeoLite2-City.mmdb")
+LOOKUPS = 100_000
+
+
+def sampleAddresses(mmdbFile: Path) -> list[ipaddress.IPv4Address | ipaddress.IPv6Address]:
+    """Addresses inside the database's networks, mostly IPv4 like our traffic."""
+    with maxminddb.open_database(mmdbFile) as reader:
+        networks = [network for network, _ in reader]
+
+    return [network.network_address + random.randrange(min(network.num_addresses, 1 << 32)) for network in random.choices(networks, k=LOOKUPS)]
+
+
+def readerLatency(mmdbFile: Path, addresses: list) -> float:
+    reader = geoip2.database.Reader(mmdbFile, mode=maxminddb.MODE_MMAP_EXT)
+    start = time.perf_counter()
+    for address in addresses:
+        try:
+            city = reader.city(address)
+            city.country.iso_code, city.location.time_zone  # noqa: B018
+        except geoip2.errors.AddressNotFoundError:
+            pass
+    elapsed = time.perf_counter() - start
+    reader.close()
+    return elapsed / len(addresses)
+
+
+def tableLatency(table: GeoIPTable, addresses: list) -> float:
+    start = time.perf_counter()
+    for address in addresses:
+        table.lookup(address)
+    return (time.perf_counter() - start) / len(addresses)
+
+
+def main() -> None:
+    mmdbFile = Path(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_DB_FILE
+    if not mmdbFile.is_file() or not mmdbFile.stat().st_size:
+        sys.exit(f"No GeoLite2 City database at {mmdbFile}")
+
+    start = time.perf_counter()
+    table = GeoIPTable.build(mmdbFile)
+    elapsed = time.perf_counter() - start
+    print(f"build: {elapsed:.1f}s, {len(table.v4Starts)} IPv4 and {len(table.v6Starts)} IPv6 ranges, {len(table.locations)} locations")
+
+    with tempfile.TemporaryDirectory() as directory:
+        table.save(Path(directory))
+        size = sum(file.stat().st_size for file in Path(directory).iterdir())
+        table = GeoIPTable.load(Path(directory))
+        print(f"on disk: {size / 1024 ** 2:.1f} MB")
+
+        addresses = sampleAddresses(mmdbFile)
+        reader, flattened = readerLatency(mmdbFile, addresses), tableLatency(table, addresses)
+        print(f"Reader.city: {reader * 1e6:>6.2f} us/lookup")
+        print(f"GeoIPTable:  {flattened * 1e6:>6.2f} us/lookup ({reader / flattened:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
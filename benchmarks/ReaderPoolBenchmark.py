@@ -0,0 +1,65 @@
+"""Concurrent timezone lookup throughput against an 80k row table for different reader pool sizes.
+
+Run from the repository root: python -m benchmarks.ReaderPoolBenchmark
+"""
+import asyncio
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from database.Migrations import Migrations
+from database.ReaderPool import ReaderPool
+
+ROWS = 80_000
+LOOKUPS = 20_000
+CONCURRENCY = 64
+POOL_SIZES = (1, 2, 4, 8)
+
+
+def buildDatabase(path: Path) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for migration in Migrations.MIGRATIONS:
+        for statement in migration.sqlite:
+            conn.execute(statement)
+
+    rows = ((user, "Europe/Prague", f"alias{user}") for user in range(ROWS))
+    conn.executemany("INSERT INTO timezones (user, timezone, alias) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+async def run(path: Path, poolSize: int) -> float:
+    pool = ReaderPool(path, poolSize)
+    await pool.open()
+
+    userIds = iter(random.choices(range(ROWS), k=LOOKUPS))
+
+    async def worker() -> None:
+        for userId in userIds:
+            await pool.fetchone("SELECT timezone FROM timezones WHERE user = ?", (userId,))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+
+    await pool.close()
+    return LOOKUPS / elapsed
+
+
+async def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "timezones.sqlite"
+        buildDatabase(path)
+
+        baseline = None
+        for poolSize in POOL_SIZES:
+            throughput = await run(path, poolSize)
+            baseline = baseline or throughput
+            print(f"{poolSize} readers: {throughput:>8.0f} lookups/s ({throughput / baseline:.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
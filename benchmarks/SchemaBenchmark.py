@@ -0,0 +1,49 @@
+"""uuid/alias lookup latency on the timezones table as it grows, before and after the index migration.
+
+Run from the repository root: python -m benchmarks.SchemaBenchmark
+"""
+import random
+import sqlite3
+import timeit
+import uuid
+
+from database.Migrations import Migrations
+
+ROW_COUNTS = (1_000, 10_000, 80_000, 200_000)
+LOOKUPS = 2_000
+
+
+def buildTable(rowCount: int) -> tuple[sqlite3.Connection, list[str], list[str]]:
+    conn = sqlite3.connect(":memory:")
+    for statement in Migrations.MIGRATIONS[0].sqlite:
+        conn.execute(statement)
+
+    rows = [(user, "Europe/Prague", f"alias{user}", str(uuid.uuid4())) for user in range(rowCount)]
+    conn.executemany("INSERT INTO timezones (user, timezone, alias, uuid) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+
+    return conn, random.choices([row[3] for row in rows], k=LOOKUPS), random.choices([row[2] for row in rows], k=LOOKUPS)
+
+
+def measure(conn: sqlite3.Connection, column: str, keys: list[str]) -> float:
+    query = f"SELECT user, timezone FROM timezones WHERE {column} = ?"
+    seconds = timeit.timeit(lambda: [conn.execute(query, (key,)).fetchone() for key in keys], number=1)
+    return seconds / len(keys) * 1e6
+
+
+def main() -> None:
+    print(f"{"rows":>8} | {"uuid scan":>10} | {"uuid index":>10} | {"alias scan":>10} | {"alias index":>11}   (us/lookup)")
+    for rowCount in ROW_COUNTS:
+        conn, uuids, aliases = buildTable(rowCount)
+        uuidScan, aliasScan = measure(conn, "uuid", uuids[:LOOKUPS // 10]), measure(conn, "alias", aliases[:LOOKUPS // 10])
+
+        for statement in Migrations.MIGRATIONS[1].sqlite:
+            conn.execute(statement)
+        uuidIndexed, aliasIndexed = measure(conn, "uuid", uuids), measure(conn, "alias", aliases)
+
+        print(f"{rowCount:>8} | {uuidScan:>10.1f} | {uuidIndexed:>10.1f} | {aliasScan:>10.1f} | {aliasIndexed:>11.1f}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
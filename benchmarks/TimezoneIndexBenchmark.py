@@ -0,0 +1,84 @@
+"""Memory use of the preloaded timezone index per 100k rows, and point lookup latency against the SQLite reader pool.
+
+Run from the repository root: python -m benchmarks.TimezoneIndexBenchmark
+"""
+import asyncio
+import random
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+
+import aiosqlite
+
+from database.Migrations import Migrations
+from database.ReaderPool import ReaderPool
+from database.TimezoneIndex import TimezoneIndex
+
+ROWS = 100_000
+LOOKUPS = 20_000
+TIMEZONES = ("Europe/Prague", "Europe/London", "America/New_York", "Asia/Tokyo", "Australia/Sydney", "America/Sao_Paulo")
+
+
+def buildDatabase(path: Path, *, withUUIDs: bool) -> None:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    for migration in Migrations.MIGRATIONS:
+        for statement in migration.sqlite:
+            conn.execute(statement)
+
+    rows = ((user, random.choice(TIMEZONES), f"alias{user}", str(uuid.uuid4()) if withUUIDs else None) for user in range(ROWS))
+    conn.executemany("INSERT INTO timezones (user, timezone, alias, uuid) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+async def loadIndex(path: Path) -> tuple[TimezoneIndex, int]:
+    async with aiosqlite.connect(path) as conn:
+        tracemalloc.start()
+        index = TimezoneIndex()
+        await index.load(conn)
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return index, size
+
+
+async def sqliteLatency(path: Path, userIds: list[int]) -> float:
+    pool = ReaderPool(path, 1)
+    await pool.open()
+
+    start = time.perf_counter()
+    for userId in userIds:
+        await pool.fetchone("SELECT timezone FROM timezones WHERE user = ?", (userId,))
+    elapsed = time.perf_counter() - start
+
+    await pool.close()
+    return elapsed / len(userIds)
+
+
+def indexLatency(index: TimezoneIndex, userIds: list[int]) -> float:
+    start = time.perf_counter()
+    for userId in userIds:
+        index.getTimezone(userId)
+    return (time.perf_counter() - start) / len(userIds)
+
+
+async def main() -> None:
+    userIds = random.choices(range(ROWS), k=LOOKUPS)
+    for withUUIDs in (False, True):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "timezones.sqlite"
+            buildDatabase(path, withUUIDs=withUUIDs)
+
+            index, size = await loadIndex(path)
+            sqlite, memory = await sqliteLatency(path, userIds), indexLatency(index, userIds)
+            print(f"{'with' if withUUIDs else 'without'} uuids: {size / ROWS * 100_000 / 1024 ** 2:.1f} MB per 100k rows")
+            print(f"  sqlite: {sqlite * 1e6:>8.2f} us/lookup")
+            print(f"  index:  {memory * 1e6:>8.2f} us/lookup ({sqlite / memory:.0f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Annotated
 
 from dataclasses_json import dataclass_json
@@ -9,6 +9,8 @@ from dataclasses_json import dataclass_json
 class MaxmindConfig:
     accountId: int
     token: str
+    downloadUrl: str = "https://download.maxmind.com/geoip/databases/GeoLite2-City/download?suffix=tar.gz"
+    refreshInterval: float = 86_400.0
 
 
 from typing import TypedDict, ReadOnly
@@ -54,6 +56,18 @@ class ServerConfig:
     apiKeysKey: str
     apiApproveChannelId: int
     devlogRoleId: int
+    sessionIdleTimeout: float = 60.0
+    sessionMaxInFlight: int = 32
+    rejectionLogInterval: float = 60.0
+    udpWorkers: int = 32
+    udpQueueSize: int = 1024
+    maxBatchSize: int = 64
+    maxBulkLookupSize: int = 500
+    usernameCacheSize: int = 10_000
+    usernameCacheTtl: float = 3600.0
+    geoIpCacheSize: int = 4096
+    offloadThreshold: int = 16_384
+    maxInflatedSize: int = 1 << 20
 
 
 @dataclass_json
@@ -65,6 +79,29 @@ class PacketLogsConfig:
     whoToPing: int
 
 
+@dataclass_json
+@dataclass
+class DatabaseConfig:
+    cacheSize: int = 10_000
+    cacheTtl: float = 300.0
+    writeBatchWindow: float = 0.005
+    writeBatchSize: int = 128
+    readerPoolSize: int = 4
+    replicationBatchSize: int = 100
+    replicationMaxBackoff: float = 60.0
+    reconcileInterval: float = 86_400.0
+    reconcileChunkSize: int = 1000
+    preloadIndex: bool = False
+    negativeFilterCapacity: int = 1_000_000
+    negativeFilterFalsePositiveRate: float = 0.01
+
+
+@dataclass_json
+@dataclass
+class StatsConfig:
+    flushInterval: float = 30.0
+
+
 @dataclass_json
 @dataclass
 class Config:
@@ -74,3 +111,5 @@ class Config:
     mariadbDetails: MariaDBConfig
     server: ServerConfig
     packetLogs: PacketLogsConfig
+    stats: StatsConfig = field(default_factory=StatsConfig)
+    database: DatabaseConfig = field(default_factory=DatabaseConfig)
@@ -1,17 +1,27 @@
 import asyncio
+from pathlib import Path
+from typing import Final
 
 import aiosqlite
 
+from database.ReaderPool import ReaderPool
+from server.Api import ApiKey
 from shell.Logger import Logger
 
 
 class ApiKeyDatabase:
-    def __init__(this, apiKeysKey: str) -> None:
+    DB_FILENAME: Final[Path] = Path("dbFiles/apiKeys.db")
+
+    def __init__(this, apiKeysKey: str, readerPoolSize: int) -> None:
         this.encryptionKey = apiKeysKey
+        this.readers = ReaderPool(this.DB_FILENAME, readerPoolSize)
+        # Raw DB form -> decoded key, so requests don't pay SQLite + AES-CBC + JSON on every call.
+        this.keys: dict[str, ApiKey] = {}
         asyncio.create_task(this._postInit())
 
     async def _postInit(this) -> None:
-        this.conn = await aiosqlite.connect("dbFiles/apiKeys.db")
+        this.conn = await aiosqlite.connect(this.DB_FILENAME)
+        await this.conn.execute("PRAGMA journal_mode=WAL")
         await this.conn.execute(
             """CREATE TABLE IF NOT EXISTS pendingApiKeys
                (
@@ -27,6 +37,36 @@ class ApiKeyDatabase:
                              );""")
 
         await this.conn.commit()
+        await this.readers.open()
+        await this.loadKeys()
+
+    async def close(this) -> None:
+        await this.readers.close()
+        await this.conn.close()
+
+    async def fetchall(this, query: str, values: tuple = ()) -> list[tuple]:
+        if this.readers:
+            return await this.readers.fetchall(query, values)
+
+        cursor = await this.conn.execute(query, values)
+        return list(await cursor.fetchall())
+
+    async def loadKeys(this) -> None:
+        keys: dict[str, ApiKey] = {}
+        for (rawKey,) in await this.fetchall("SELECT base64repr FROM apiKeys"):
+            if apiKey := this.decodeKey(rawKey):
+                keys[rawKey] = apiKey
+
+        this.keys = keys
+        Logger.log(f"Loaded {len(keys)} API keys.")
+
+    @staticmethod
+    def decodeKey(rawKey: str) -> ApiKey | None:
+        try:
+            return ApiKey.fromDbForm(rawKey)
+        except (ValueError, TypeError) as e:
+            Logger.error(f"Could not decode an API key: {e!s}")
+            return None
 
     async def addToPending(this, apiKey: str, messageId: int) -> None:
         query = "INSERT INTO pendingApiKeys (base64repr, messageId) VALUES (?, ?)"
@@ -44,25 +84,35 @@ class ApiKeyDatabase:
 
         query = "INSERT INTO apiKeys VALUES (?)"
         await cursor.execute(query, (row[0],))
-        await cursor.connection.commit()
+        await this.conn.commit()
 
         query = "DELETE FROM pendingApiKeys WHERE base64repr = ?"
         await cursor.execute(query, (apiKey,))
-        await cursor.connection.commit()
+        await this.conn.commit()
+
+        if decoded := this.decodeKey(row[0]):
+            this.keys[row[0]] = decoded
 
     async def getRequestByMsgId(this, msgId: int) -> str:
         query = "SELECT base64repr FROM pendingApiKeys WHERE messageId = ?"
-
-        cursor = await this.conn.execute(query, (msgId,))
-        return (await cursor.fetchone())[0]
+        return (await this.fetchall(query, (msgId,)))[0][0]
 
     async def flushRequest(this, apiKey: str) -> None:
+        # Only pending keys are flushed, the cache holds approved ones and moveToReal adds them itself
         query = "DELETE FROM pendingApiKeys WHERE base64repr = ?"
-        cursor = await this.conn.execute(query, (apiKey,))
-        await cursor.connection.commit()
+        await this.conn.execute(query, (apiKey,))
+        await this.conn.commit()
 
-    async def isValidKey(this, apiKey: str) -> bool:
-        query = "SELECT EXISTS(SELECT 1 FROM apiKeys WHERE base64repr = ?)"
+    async def revokeKey(this, apiKey: str) -> bool:
+        this.keys.pop(apiKey, None)
 
+        query = "DELETE FROM apiKeys WHERE base64repr = ?"
         cursor = await this.conn.execute(query, (apiKey,))
-        return (await cursor.fetchone())[0]
+        await this.conn.commit()
+        return cursor.rowcount != 0
+
+    def getKey(this, apiKey: str) -> ApiKey | None:
+        return this.keys.get(apiKey)
+
+    async def isValidKey(this, apiKey: str) -> bool:
+        return apiKey in this.keys
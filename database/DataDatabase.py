@@ -1,83 +1,443 @@
 import asyncio
+import json
+import sqlite3
+import time
 from pathlib import Path
 from typing import Final, LiteralString
 
 import aiomysql
 import aiosqlite
 
-from config.Config import MariaDBConfig
+from config.Config import DatabaseConfig, MariaDBConfig
+from database.Migrations import Migrations
+from database.ReaderPool import ReaderPool
+from database.Reconciler import MariaDBTimezoneStore, Reconciler, ReconcileResult, SqliteTimezoneStore
+from database.Replicator import MariaDBReplicator
+from database.TimezoneIndex import TimezoneIndex
+from shared.BloomFilter import BloomFilter
+from shared.Cache import MISSING, LRUCache
 from shared.Helpers import Helpers
+from shared.SingleFlight import SingleFlight
 from shell.Logger import Logger
 
 
 class Database:
     DB_FILENAME: Final[Path] = Path("dbFiles/timezones.sqlite")
 
-    def __init__(this, mdbConfig: MariaDBConfig) -> None:
+    def __init__(this, mdbConfig: MariaDBConfig, dbConfig: DatabaseConfig) -> None:
         this.mdbConfig = mdbConfig
+        this.dbConfig = dbConfig
 
-        asyncio.create_task(this._postInit())
+        # user -> timezone, user -> uuid and uuid -> user. None is cached too, so unknown IDs don't hit SQLite either.
+        this.timezoneCache: LRUCache[int, str | None] = LRUCache(dbConfig.cacheSize, dbConfig.cacheTtl)
+        this.uuidCache: LRUCache[int, str | None] = LRUCache(dbConfig.cacheSize, dbConfig.cacheTtl)
+        this.userCache: LRUCache[str, int | None] = LRUCache(dbConfig.cacheSize, dbConfig.cacheTtl)
+        # Serves every lookup once loaded, if preloading is enabled
+        this.index: TimezoneIndex | None = None
+        # Registered user IDs and UUIDs. Writes add to them before they are queued, lookups only trust them once loaded.
+        this.userFilter: BloomFilter | None = None
+        this.uuidFilter: BloomFilter | None = None
+        if dbConfig.negativeFilterCapacity:
+            this.userFilter = BloomFilter(dbConfig.negativeFilterCapacity, dbConfig.negativeFilterFalsePositiveRate)
+            this.uuidFilter = BloomFilter(dbConfig.negativeFilterCapacity, dbConfig.negativeFilterFalsePositiveRate)
+        this.filtersLoaded = False
+        # Concurrent cache misses for the same key share one query. The cache generations are part of the key,
+        # so a lookup that started before a write is never joined by one that started after it.
+        this.lookups: SingleFlight[tuple, object] = SingleFlight()
+
+        # (query, MariaDB query, values, future) waiting for the next group commit
+        this.writeQueue: asyncio.Queue[tuple[LiteralString, LiteralString | None, tuple, asyncio.Future[int | None]]] = asyncio.Queue()
+        this.writerTask: asyncio.Task | None = None
+        this.readers = ReaderPool(this.DB_FILENAME, dbConfig.readerPoolSize)
+        this.replicator = MariaDBReplicator(this, mdbConfig, dbConfig)
+        this.reconcileLock = asyncio.Lock()
+        this.reconcileTask: asyncio.Task | None = None
+        this.batchedWrites = 0
+        this.groupCommits = 0
+
+        # Awaited before the bot starts, a failed migration must stop it instead of leaving a half-migrated schema behind
+        this.initTask = asyncio.create_task(this._postInit())
 
     async def _postInit(this) -> None:
         this.conn = await aiosqlite.connect(this.DB_FILENAME)
+        # WAL lets reads proceed while a group commit is being written
+        await this.conn.execute("PRAGMA journal_mode=WAL")
+        await Migrations.migrateSqlite(this.conn)
+        if this.dbConfig.preloadIndex:
+            index = TimezoneIndex()
+            await index.load(this.conn)
+            this.index = index
+            Logger.log(f"Preloaded {len(index)} timezones into memory.")
+        if this.userFilter:
+            await this.loadFilters()
+        await this.readers.open()
+        this.writerTask = asyncio.create_task(this.runWriter())
+        this.replicator.start()
+        if this.dbConfig.reconcileInterval > 0:
+            this.reconcileTask = asyncio.create_task(this.reconcilePeriodically())
+
+    def getMetrics(this) -> dict[str, object]:
+        metrics = {}
+        for name, cache in (("timezone", this.timezoneCache), ("uuid", this.uuidCache), ("user", this.userCache)):
+            metrics.update({f"db.cache.{name}.{key}": value for key, value in cache.getMetrics().items()})
+
+        metrics.update({f"db.singleflight.{key}": value for key, value in this.lookups.getMetrics().items()})
+        metrics.update({f"db.readers.{key}": value for key, value in this.readers.getMetrics().items()})
+        metrics.update({f"db.replication.{key}": value for key, value in this.replicator.getMetrics().items()})
+        if this.index is not None:
+            metrics["db.index.rows"] = len(this.index)
+        if this.userFilter:
+            metrics.update({f"db.filter.user.{key}": value for key, value in this.userFilter.getMetrics().items()})
+            metrics.update({f"db.filter.uuid.{key}": value for key, value in this.uuidFilter.getMetrics().items()})
+        metrics["db.writes.queued"] = this.writeQueue.qsize()
+        metrics["db.writes.batched"] = this.batchedWrites
+        metrics["db.writes.groupCommits"] = this.groupCommits
+        return metrics
+
+    async def close(this) -> None:
+        if this.reconcileTask:
+            this.reconcileTask.cancel()
+        await this.replicator.close()
+        await this.writeQueue.join()
+        if this.writerTask:
+            this.writerTask.cancel()
+        await this.readers.close()
+        await this.conn.close()
+
+    async def loadFilters(this) -> None:
+        cursor = await this.conn.execute("SELECT user, uuid FROM timezones")
+        async for userId, uuid in cursor:
+            this.userFilter.add(userId)
+            if uuid:
+                this.uuidFilter.add(uuid)
+
+        this.filtersLoaded = True
+        if this.userFilter.count > this.userFilter.capacity:
+            Logger.warning(f"{this.userFilter.count} users exceed the negative filter capacity, its false positive rate will suffer.")
+
+    def mightHaveUser(this, userId: int) -> bool:
+        return not this.filtersLoaded or userId in this.userFilter
+
+    def mightHaveUUID(this, uuid: Helpers.UUIDStr) -> bool:
+        return not this.filtersLoaded or uuid in this.uuidFilter
+
+    async def reconcile(this) -> ReconcileResult | None:
+        """
+        Repairs MariaDB from SQLite where their chunk digests differ. Skipped while replication is behind, the outbox would look like drift.
+        Replication is paused while the lock is held.
+        """
+        async with this.reconcileLock:
+            await this.replicator.refreshBacklog()
+            if this.replicator.pending:
+                Logger.warning(f"Skipping reconciliation, {this.replicator.pending} writes are still waiting for replication.")
+                return None
+
+            source = SqliteTimezoneStore(this.DB_FILENAME)
+            await source.open()
+            try:
+                replica = MariaDBTimezoneStore(await this.replicator.getPool())
+                result = await Reconciler(source, replica, this.dbConfig.reconcileChunkSize).reconcile()
+            finally:
+                await source.close()
+
+        Logger.log(
+            f"Reconciled {result.chunks} chunks in {result.elapsed:.2f}s: {result.differingChunks} differed, "
+            f"{result.upserted} rows repaired, {result.deleted} deleted, {result.conflicts} conflicts."
+        )
+        return result
+
+    async def reconcilePeriodically(this) -> None:
+        while True:
+            await asyncio.sleep(this.dbConfig.reconcileInterval)
+            try:
+                await this.reconcile()
+            except (aiomysql.Error, sqlite3.Error, OSError) as e:
+                Logger.error(f"Reconciliation failed: {e!s}")
+
+    async def runWriter(this) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await this.writeQueue.get()]
+            deadline = loop.time() + this.dbConfig.writeBatchWindow
+            while len(batch) < this.dbConfig.writeBatchSize:
+                try:
+                    batch.append(this.writeQueue.get_nowait())
+                except asyncio.QueueEmpty:
+                    if (timeout := deadline - loop.time()) <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(this.writeQueue.get(), timeout))
+                    except TimeoutError:
+                        break
+
+            try:
+                await this.commitBatch(batch)
+            finally:
+                for _ in batch:
+                    this.writeQueue.task_done()
+
+    async def commitBatch(this, batch: list[tuple[LiteralString, LiteralString | None, tuple, asyncio.Future[int | None]]]) -> None:
+        """
+        Runs every queued write in one transaction. Each write gets a savepoint, so a constraint violation only fails its own caller.
+        A write's MariaDB statement goes into the outbox in the same transaction, so it is replicated if and only if the write landed.
+        """
+        results: list[tuple[asyncio.Future[int | None], int | None]] = []
+        replicated = False
         try:
-            this.mdbPool = await aiomysql.create_pool(
-                loop=asyncio.get_event_loop(),
-                **this.mdbConfig.to_connection_params(),
-            )
-        except Exception:
-            Logger.error("MDB is not available!")
-            this.mdbPool = None
+            await this.conn.execute("BEGIN")
+            for query, mdbQuery, values, future in batch:
+                await this.conn.execute("SAVEPOINT write")
+                try:
+                    cursor = await this.conn.execute(query, values)
+                    results.append((future, cursor.rowcount))
+                    if mdbQuery and cursor.rowcount:
+                        await this.conn.execute(
+                            "INSERT INTO replication_outbox (query, params, createdAt) VALUES (?, ?, ?)",
+                            (mdbQuery, json.dumps(values), time.time()),
+                        )
+                        replicated = True
+                except sqlite3.IntegrityError:
+                    await this.conn.execute("ROLLBACK TO write")
+                    results.append((future, None))
+                await this.conn.execute("RELEASE write")
+
+            await this.conn.commit()
+        except sqlite3.Error as e:
+            Logger.error(f"Group commit of {len(batch)} writes failed: {e!s}")
+            await this.conn.rollback()
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        if replicated:
+            this.replicator.notify()
+
+        this.batchedWrites += len(batch)
+        this.groupCommits += 1
+        for future, rowcount in results:
+            if not future.done():
+                future.set_result(rowcount)
+
+    async def queueWrite(this, query: LiteralString, values: tuple, mdbQuery: LiteralString | None = None) -> int | None:
+        """Resolves to the write's rowcount once its batch is committed, or None if it broke a constraint."""
+        future = asyncio.get_running_loop().create_future()
+        await this.writeQueue.put((query, mdbQuery, values, future))
+        return await future
 
     async def executeSetQuery(this, query: LiteralString, mdbQuery: LiteralString, values: tuple) -> bool:
+        # Unique uuid/alias violations are a failed write, not an error. MariaDB is caught up by the replicator.
+        return bool(await this.queueWrite(query, values, mdbQuery))
+
+    async def executeGetRowQuery(this, query: LiteralString, values: tuple) -> tuple | None:
+        if this.readers:
+            return await this.readers.fetchone(query, values)
+
         cursor = await this.conn.execute(query, values)
-        await this.conn.commit()
+        return await cursor.fetchone()
 
-        if this.mdbPool:
-            async with this.mdbPool.acquire() as conn, conn.cursor() as cur:
-                await cur.execute(mdbQuery, values)
+    async def executeGetRowsQuery(this, query: LiteralString, values: tuple) -> list[tuple]:
+        if this.readers:
+            return await this.readers.fetchall(query, values)
 
-                return cursor.rowcount != 0 and cur.rowcount != 0
-        return cursor.rowcount != 0
+        cursor = await this.conn.execute(query, values)
+        return list(await cursor.fetchall())
 
     async def executeGetStrQuery(this, query: LiteralString, values: tuple) -> str | None:
-        cursor = await this.conn.execute(query, values)
-        await this.conn.commit()
-        if val := await cursor.fetchone():
+        if val := await this.executeGetRowQuery(query, values):
             return val[0]
 
         return None
 
     async def setTimezone(this, userId: int, timezone: str, alias: str) -> bool:
-        query = "INSERT INTO timezones (user, timezone) VALUES (?, ?)\
-                 ON CONFLICT DO UPDATE SET timezone = ?, alias = ?;"
-        mdbQuery = "INSERT INTO timezones (user, timezone) VALUES (%s, %s)\
+        query = "INSERT INTO timezones (user, timezone, alias) VALUES (?, ?, ?)\
+                 ON CONFLICT(user) DO UPDATE SET timezone = ?, alias = ?;"
+        mdbQuery = "INSERT INTO timezones (user, timezone, alias) VALUES (%s, %s, %s)\
                  ON DUPLICATE KEY UPDATE timezone = %s, alias = %s;"
 
-        return await this.executeSetQuery(query, mdbQuery, (userId, timezone.replace(" ", "_"), alias, timezone.replace(" ", "_"), alias))
+        timezone = timezone.replace(" ", "_")
+        this.timezoneCache.invalidate(userId)
+        if this.userFilter:
+            this.userFilter.add(userId)
+
+        result = await this.executeSetQuery(query, mdbQuery, (userId, timezone, alias, timezone, alias))
+        if result:
+            this.timezoneCache.set(userId, timezone)
+            if this.index is not None:
+                this.index.setTimezone(userId, timezone, alias)
+        return result
+
+    async def setAlias(this, userId: int, alias: str) -> bool:
+        query = "UPDATE timezones SET alias = ? WHERE user = ?"
+        result = await this.executeSetQuery(query, query.replace("?", "%s"), (alias, userId))
+        if result and this.index is not None:
+            this.index.setAlias(userId, alias)
+        return result
 
     async def getTimeZone(this, userId: int) -> str | None:
+        if this.index is not None:
+            return this.index.getTimezone(userId)
+        if not this.mightHaveUser(userId):
+            return None
+        if (timezone := this.timezoneCache.get(userId)) is not MISSING:
+            return timezone
+
         query = "SELECT timezone from timezones WHERE user = ?"
-        return await this.executeGetStrQuery(query, (userId,))
+        generation = this.timezoneCache.generation
+        timezone = await this.lookups.run((query, userId, generation), this.executeGetStrQuery, query, (userId,))
+        this.timezoneCache.set(userId, timezone, generation)
+        return timezone
 
     async def assignUUIDToUserId(this, uuid: Helpers.UUIDStr, userId: int, timezone: str) -> bool:
         query = "INSERT INTO timezones (user, uuid, timezone, alias) VALUES (?, ?, ?, ?) ON CONFLICT(user) DO UPDATE SET uuid = ?;"
         mdbQuery = "INSERT INTO timezones (user, uuid, timezone, alias) VALUES (%s, %s, %s, %s) ON DUPLICATE KEY UPDATE uuid = %s;"
 
-        return await this.executeSetQuery(query, mdbQuery, (userId, uuid, timezone.replace(" ", "_"), uuid, uuid))
+        previousUUID = await this.getUUIDByUserId(userId)
+        this.invalidateUser(userId, previousUUID, uuid)
+
+        timezone = timezone.replace(" ", "_")
+        if this.userFilter:
+            this.userFilter.add(userId)
+            this.uuidFilter.add(uuid)
+        result = await this.executeSetQuery(query, mdbQuery, (userId, uuid, timezone, uuid, uuid))
+        if result:
+            this.uuidCache.set(userId, uuid)
+            this.userCache.set(uuid, userId)
+            if this.index is not None:
+                this.index.assignUUID(userId, uuid, timezone)
+        return result
 
     async def unassignUUIDFromUserId(this, userId: int) -> bool:
         query = "UPDATE timezones SET uuid = NULL WHERE user = ?"
-        return await this.executeSetQuery(query, query.replace("?", "%s"), (userId,))
+
+        previousUUID = await this.getUUIDByUserId(userId)
+        this.invalidateUser(userId, previousUUID)
+
+        result = await this.executeSetQuery(query, query.replace("?", "%s"), (userId,))
+        if result:
+            this.uuidCache.set(userId, None)
+            if previousUUID:
+                this.userCache.set(previousUUID, None)
+            if this.index is not None:
+                this.index.unassignUUID(userId)
+        return result
+
+    def invalidateUser(this, userId: int, *uuids: str | None) -> None:
+        this.timezoneCache.invalidate(userId)
+        this.uuidCache.invalidate(userId)
+        for uuid in uuids:
+            if uuid:
+                this.userCache.invalidate(uuid)
 
     async def getUUIDByUserId(this, userId: int) -> str | None:
+        if this.index is not None:
+            return this.index.getUUID(userId)
+        if not this.mightHaveUser(userId):
+            return None
+        if (uuid := this.uuidCache.get(userId)) is not MISSING:
+            return uuid
+
         query = "SELECT uuid from timezones WHERE user = ?"
-        return await this.executeGetStrQuery(query, (userId,))
+        generation = this.uuidCache.generation
+        uuid = await this.lookups.run((query, userId, generation), this.executeGetStrQuery, query, (userId,))
+        this.uuidCache.set(userId, uuid, generation)
+        return uuid
 
     async def getUserIdByUUID(this, uuid: Helpers.UUIDStr) -> str | None:
+        if this.index is not None:
+            return this.index.getUserId(uuid)
+        if not this.mightHaveUUID(uuid):
+            return None
+        if (userId := this.userCache.get(uuid)) is not MISSING:
+            return userId
+
         query = "SELECT user from timezones WHERE uuid = ?"
-        return await this.executeGetStrQuery(query, (uuid,))
+        generation = this.userCache.generation
+        userId = await this.lookups.run((query, uuid, generation), this.executeGetStrQuery, query, (uuid,))
+        this.userCache.set(uuid, userId, generation)
+        return userId
 
     async def getTimezoneByUUID(this, uuid: Helpers.UUIDStr) -> str | None:
-        query = "SELECT timezone from timezones WHERE uuid = ?"
-        return await this.executeGetStrQuery(query, (uuid,))
+        if this.index is not None:
+            userId = this.index.getUserId(uuid)
+            return this.index.getTimezone(userId) if userId is not None else None
+        if not this.mightHaveUUID(uuid):
+            return None
+
+        userId = this.userCache.get(uuid)
+        if userId is None:
+            return None
+        if userId is not MISSING:
+            return await this.getTimeZone(userId)
+
+        query = "SELECT user, timezone from timezones WHERE uuid = ?"
+        userGeneration, timezoneGeneration = this.userCache.generation, this.timezoneCache.generation
+        row = await this.lookups.run((query, uuid, userGeneration, timezoneGeneration), this.executeGetRowQuery, query, (uuid,))
+        if not row:
+            this.userCache.set(uuid, None, userGeneration)
+            return None
+
+        this.userCache.set(uuid, row[0], userGeneration)
+        this.timezoneCache.set(row[0], row[1], timezoneGeneration)
+        return row[1]
+
+    @staticmethod
+    def inClause(count: int) -> LiteralString:
+        return ", ".join("?" for _ in range(count))
+
+    async def getTimezones(this, userIds: list[int]) -> dict[int, str | None]:
+        if this.index is not None:
+            return {userId: this.index.getTimezone(userId) for userId in userIds}
+
+        timezones: dict[int, str | None] = {}
+        missing: list[int] = []
+        for userId in dict.fromkeys(userIds):
+            if not this.mightHaveUser(userId):
+                timezones[userId] = None
+            elif (timezone := this.timezoneCache.get(userId)) is not MISSING:
+                timezones[userId] = timezone
+            else:
+                missing.append(userId)
+
+        if missing:
+            query = f"SELECT user, timezone FROM timezones WHERE user IN ({this.inClause(len(missing))})"
+            generation = this.timezoneCache.generation
+            found = dict(await this.executeGetRowsQuery(query, tuple(missing)))
+            for userId in missing:
+                timezones[userId] = found.get(userId)
+                this.timezoneCache.set(userId, timezones[userId], generation)
+
+        return timezones
+
+    async def getTimezonesByUUIDs(this, uuids: list[Helpers.UUIDStr]) -> dict[Helpers.UUIDStr, str | None]:
+        if this.index is not None:
+            return {uuid: this.index.getTimezone(userId) if (userId := this.index.getUserId(uuid)) is not None else None for uuid in uuids}
+
+        timezones: dict[Helpers.UUIDStr, str | None] = {}
+        missing: list[Helpers.UUIDStr] = []
+        for uuid in dict.fromkeys(uuids):
+            if not this.mightHaveUUID(uuid):
+                timezones[uuid] = None
+                continue
+
+            userId = this.userCache.get(uuid)
+            timezone = this.timezoneCache.get(userId) if userId not in (None, MISSING) else MISSING
+            if userId is None:
+                timezones[uuid] = None
+            elif timezone is not MISSING:
+                timezones[uuid] = timezone
+            else:
+                missing.append(uuid)
+
+        if missing:
+            query = f"SELECT uuid, user, timezone FROM timezones WHERE uuid IN ({this.inClause(len(missing))})"
+            userGeneration, timezoneGeneration = this.userCache.generation, this.timezoneCache.generation
+            found = {uuid: (userId, timezone) for uuid, userId, timezone in await this.executeGetRowsQuery(query, tuple(missing))}
+            for uuid in missing:
+                userId, timezone = found.get(uuid, (None, None))
+                this.userCache.set(uuid, userId, userGeneration)
+                if userId is not None:
+                    this.timezoneCache.set(userId, timezone, timezoneGeneration)
+                timezones[uuid] = timezone
+
+        return timezones
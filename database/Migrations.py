@@ -0,0 +1,135 @@
+from dataclasses import dataclass
+from typing import Final
+
+import aiomysql
+import aiosqlite
+
+from shell.Logger import Logger
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    sqlite: tuple[str, ...]
+    mariadb: tuple[str, ...]
+
+
+class MigrationError(RuntimeError):
+    pass
+
+
+class Migrations:
+    """Versioned schema changes for the timezones database, applied in order on both backends at startup."""
+
+    MIGRATIONS: Final[tuple[Migration, ...]] = (
+        Migration(
+            1,
+            "Create the timezones table",
+            (
+                """CREATE TABLE IF NOT EXISTS timezones
+                   (
+                       user     INTEGER PRIMARY KEY NOT NULL,
+                       timezone TEXT                NOT NULL,
+                       alias    TEXT,
+                       uuid     TEXT
+                   );""",
+            ),
+            (
+                """CREATE TABLE IF NOT EXISTS timezones
+                   (
+                       user     BIGINT UNSIGNED PRIMARY KEY NOT NULL,
+                       timezone VARCHAR(64)                 NOT NULL,
+                       alias    VARCHAR(64),
+                       uuid     CHAR(36)
+                   );""",
+            ),
+        ),
+        Migration(
+            2,
+            "Unique indexes for uuid and alias lookups",
+            # Older trees never enforced uniqueness, the lowest user id keeps a duplicated uuid or alias and the others lose it
+            (
+                "UPDATE timezones SET uuid = NULL WHERE uuid IS NOT NULL AND user NOT IN (SELECT MIN(user) FROM timezones GROUP BY uuid);",
+                "UPDATE timezones SET alias = NULL WHERE alias IS NOT NULL AND user NOT IN (SELECT MIN(user) FROM timezones GROUP BY alias);",
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_timezones_uuid ON timezones (uuid);",
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_timezones_alias ON timezones (alias);",
+            ),
+            (
+                """UPDATE timezones t JOIN (SELECT uuid, MIN(user) AS keptUser FROM timezones GROUP BY uuid HAVING COUNT(*) > 1) d
+                   ON t.uuid = d.uuid SET t.uuid = NULL WHERE t.user <> d.keptUser;""",
+                """UPDATE timezones t JOIN (SELECT alias, MIN(user) AS keptUser FROM timezones GROUP BY alias HAVING COUNT(*) > 1) d
+                   ON t.alias = d.alias SET t.alias = NULL WHERE t.user <> d.keptUser;""",
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_timezones_uuid ON timezones (uuid(36));",
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_timezones_alias ON timezones (alias(64));",
+            ),
+        ),
+        Migration(
+            3,
+            "Outbox for MariaDB replication",
+            (
+                """CREATE TABLE IF NOT EXISTS replication_outbox
+                   (
+                       id        INTEGER PRIMARY KEY AUTOINCREMENT,
+                       query     TEXT NOT NULL,
+                       params    TEXT NOT NULL,
+                       createdAt REAL NOT NULL
+                   );""",
+            ),
+            (),
+        ),
+    )
+
+    LATEST_VERSION: Final[int] = MIGRATIONS[-1].version
+
+    @staticmethod
+    async def migrateSqlite(conn: aiosqlite.Connection) -> int:
+        await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER PRIMARY KEY NOT NULL, appliedAt TEXT NOT NULL);")
+        cursor = await conn.execute("SELECT MAX(version) FROM schema_version")
+        version = (await cursor.fetchone())[0] or 0
+
+        for migration in Migrations.MIGRATIONS:
+            if migration.version <= version:
+                continue
+
+            try:
+                for statement in migration.sqlite:
+                    cursor = await conn.execute(statement)
+                    if cursor.rowcount > 0:
+                        Logger.warning(f"SQLite migration {migration.version} changed {cursor.rowcount} rows")
+                await conn.execute("INSERT INTO schema_version (version, appliedAt) VALUES (?, datetime('now'))", (migration.version,))
+                await conn.commit()
+            except aiosqlite.Error as e:
+                await conn.rollback()
+                raise MigrationError(f"SQLite migration {migration.version} ({migration.description}) failed: {e!s}") from e
+
+            version = migration.version
+            Logger.log(f"Applied SQLite migration {version}: {migration.description}")
+
+        return version
+
+    @staticmethod
+    async def migrateMariaDB(pool: aiomysql.Pool) -> int:
+        async with pool.acquire() as conn, conn.cursor() as cur:
+            await cur.execute("CREATE TABLE IF NOT EXISTS schema_version (version INT PRIMARY KEY NOT NULL, appliedAt DATETIME NOT NULL);")
+            await cur.execute("SELECT MAX(version) FROM schema_version")
+            version = (await cur.fetchone())[0] or 0
+
+            for migration in Migrations.MIGRATIONS:
+                if migration.version <= version:
+                    continue
+
+                try:
+                    for statement in migration.mariadb:
+                        if await cur.execute(statement) > 0:
+                            Logger.warning(f"MariaDB migration {migration.version} changed {cur.rowcount} rows")
+                    await cur.execute("INSERT INTO schema_version (version, appliedAt) VALUES (%s, NOW())", (migration.version,))
+                    await conn.commit()
+                except aiomysql.Error as e:
+                    await conn.rollback()
+                    raise MigrationError(f"MariaDB migration {migration.version} ({migration.description}) failed: {e!s}") from e
+
+                version = migration.version
+                Logger.log(f"Applied MariaDB migration {version}: {migration.description}")
+
+        return version
@@ -0,0 +1,55 @@
+from pathlib import Path
+from typing import LiteralString
+
+import aiosqlite
+
+
+class ReaderPool:
+    """
+    Read-only connections to a WAL database. aiosqlite runs each connection on its own thread, so reads spread over
+    the pool run in parallel instead of queueing behind each other and the writer. Each read goes to the least busy connection.
+    """
+
+    def __init__(this, path: Path, size: int) -> None:
+        this.path = path
+        this.size = size
+        this.connections: list[aiosqlite.Connection] = []
+        this.busy: list[int] = []
+        this.reads = 0
+
+    async def open(this) -> None:
+        for _ in range(this.size):
+            conn = await aiosqlite.connect(f"file:{this.path}?mode=ro", uri=True)
+            this.connections.append(conn)
+            this.busy.append(0)
+
+    async def close(this) -> None:
+        connections, this.connections, this.busy = this.connections, [], []
+        for conn in connections:
+            await conn.close()
+
+    def __bool__(this) -> bool:
+        return bool(this.connections)
+
+    async def fetchone(this, query: LiteralString, values: tuple) -> tuple | None:
+        return await this.run(query, values, False)
+
+    async def fetchall(this, query: LiteralString, values: tuple) -> list[tuple]:
+        return await this.run(query, values, True)
+
+    async def run(this, query: LiteralString, values: tuple, fetchAll: bool) -> tuple | list[tuple] | None:
+        index = min(range(len(this.connections)), key=this.busy.__getitem__)
+        this.busy[index] += 1
+        this.reads += 1
+        try:
+            cursor = await this.connections[index].execute(query, values)
+            try:
+                return list(await cursor.fetchall()) if fetchAll else await cursor.fetchone()
+            finally:
+                await cursor.close()
+        finally:
+            if index < len(this.busy):
+                this.busy[index] -= 1
+
+    def getMetrics(this) -> dict[str, object]:
+        return {"size": len(this.connections), "inFlight": sum(this.busy), "reads": this.reads}
@@ -0,0 +1,199 @@
+import asyncio
+import math
+import time
+import zlib
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+
+import aiomysql
+import aiosqlite
+
+from shell.Logger import Logger
+
+type TimezoneRow = tuple[int, str, str | None, str | None]
+
+
+class TimezoneStore(ABC):
+    """
+    One copy of the timezones table, as seen by the reconciler. Rows hash as CRC32 of user|timezone|alias|uuid,
+    a NULL alias or uuid as a NUL byte and a present one prefixed with '=', so NULL and '' never hash the same.
+    """
+
+    @abstractmethod
+    async def stats(this) -> tuple[int, int | None, int | None]:
+        """Row count, lowest and highest user ID."""
+
+    @abstractmethod
+    async def chunkDigests(this, low: int, width: int) -> dict[int, tuple[int, int]]:
+        """Chunk index -> (row count, sum of row hashes) for every non-empty chunk of `width` user IDs starting at `low`."""
+
+    @abstractmethod
+    async def fetchRange(this, start: int, end: int) -> dict[int, TimezoneRow]:
+        """Every row with start <= user < end."""
+
+    @abstractmethod
+    async def delete(this, userIds: list[int]) -> None: ...
+
+    @abstractmethod
+    async def upsert(this, row: TimezoneRow) -> bool:
+        """False if the row breaks a unique constraint."""
+
+
+class SqliteTimezoneStore(TimezoneStore):
+    def __init__(this, path: Path) -> None:
+        this.path = path
+        this.conn: aiosqlite.Connection | None = None
+
+    async def open(this) -> None:
+        this.conn = await aiosqlite.connect(this.path)
+        await this.conn.create_function("crc32", 1, lambda value: zlib.crc32(value.encode()), deterministic=True)
+
+    async def close(this) -> None:
+        if this.conn:
+            await this.conn.close()
+            this.conn = None
+
+    async def stats(this) -> tuple[int, int | None, int | None]:
+        cursor = await this.conn.execute("SELECT COUNT(*), MIN(user), MAX(user) FROM timezones")
+        return await cursor.fetchone()
+
+    async def chunkDigests(this, low: int, width: int) -> dict[int, tuple[int, int]]:
+        query = "SELECT (user - ?) / ?, COUNT(*),\
+                 SUM(crc32(user || '|' || timezone || '|' || IFNULL('=' || alias, char(0)) || '|' || IFNULL('=' || uuid, char(0))))\
+                 FROM timezones GROUP BY 1"
+        cursor = await this.conn.execute(query, (low, width))
+        return {chunk: (count, digest) for chunk, count, digest in await cursor.fetchall()}
+
+    async def fetchRange(this, start: int, end: int) -> dict[int, TimezoneRow]:
+        cursor = await this.conn.execute("SELECT user, timezone, alias, uuid FROM timezones WHERE user >= ? AND user < ?", (start, end))
+        return {row[0]: row for row in await cursor.fetchall()}
+
+    async def delete(this, userIds: list[int]) -> None:
+        await this.conn.executemany("DELETE FROM timezones WHERE user = ?", ((userId,) for userId in userIds))
+        await this.conn.commit()
+
+    async def upsert(this, row: TimezoneRow) -> bool:
+        query = "INSERT INTO timezones (user, timezone, alias, uuid) VALUES (?, ?, ?, ?)\
+                 ON CONFLICT(user) DO UPDATE SET timezone = excluded.timezone, alias = excluded.alias, uuid = excluded.uuid"
+        try:
+            await this.conn.execute(query, row)
+        except aiosqlite.IntegrityError:
+            await this.conn.rollback()
+            return False
+
+        await this.conn.commit()
+        return True
+
+
+class MariaDBTimezoneStore(TimezoneStore):
+    def __init__(this, pool: aiomysql.Pool) -> None:
+        this.pool = pool
+
+    async def fetchall(this, query: str, values: tuple) -> list[tuple]:
+        async with this.pool.acquire() as conn, conn.cursor() as cur:
+            await cur.execute(query, values)
+            return list(await cur.fetchall())
+
+    async def stats(this) -> tuple[int, int | None, int | None]:
+        return (await this.fetchall("SELECT COUNT(*), MIN(user), MAX(user) FROM timezones", ()))[0]
+
+    async def chunkDigests(this, low: int, width: int) -> dict[int, tuple[int, int]]:
+        # Hashed as UTF-8 like SQLite does, whatever the column charset
+        query = "SELECT (user - %s) DIV %s, COUNT(*),\
+                 SUM(CRC32(CONVERT(CONCAT_WS('|', user, timezone,\
+                     IFNULL(CONCAT('=', alias), CHAR(0 USING utf8mb4)), IFNULL(CONCAT('=', uuid), CHAR(0 USING utf8mb4))) USING utf8mb4)))\
+                 FROM timezones GROUP BY 1"
+        return {int(chunk): (count, int(digest)) for chunk, count, digest in await this.fetchall(query, (low, width))}
+
+    async def fetchRange(this, start: int, end: int) -> dict[int, TimezoneRow]:
+        rows = await this.fetchall("SELECT user, timezone, alias, uuid FROM timezones WHERE user >= %s AND user < %s", (start, end))
+        return {row[0]: row for row in rows}
+
+    async def delete(this, userIds: list[int]) -> None:
+        async with this.pool.acquire() as conn, conn.cursor() as cur:
+            await cur.executemany("DELETE FROM timezones WHERE user = %s", [(userId,) for userId in userIds])
+            await conn.commit()
+
+    async def upsert(this, row: TimezoneRow) -> bool:
+        # ON DUPLICATE KEY would also fire on an alias/uuid clash and overwrite the other user's row
+        userId, timezone, alias, uuid = row
+        async with this.pool.acquire() as conn, conn.cursor() as cur:
+            try:
+                await cur.execute("UPDATE timezones SET timezone = %s, alias = %s, uuid = %s WHERE user = %s", (timezone, alias, uuid, userId))
+                if not cur.rowcount:
+                    await cur.execute("INSERT INTO timezones (user, timezone, alias, uuid) VALUES (%s, %s, %s, %s)", row)
+            except aiomysql.IntegrityError:
+                await conn.rollback()
+                return False
+
+            await conn.commit()
+            return True
+
+
+@dataclass(frozen=True)
+class ReconcileResult:
+    chunks: int
+    differingChunks: int
+    upserted: int
+    deleted: int
+    conflicts: int
+    elapsed: float
+
+
+class Reconciler:
+    """
+    Finds and repairs drift between the source of truth and a replica. Both stores are split into the same user ID ranges
+    and only compare one (count, hash sum) pair per range, rows are only pulled for the ranges whose digests differ.
+    """
+
+    def __init__(this, source: TimezoneStore, replica: TimezoneStore, chunkSize: int) -> None:
+        this.source = source
+        this.replica = replica
+        this.chunkSize = chunkSize
+
+    async def reconcile(this) -> ReconcileResult:
+        started = time.perf_counter()
+        sourceStats, replicaStats = await asyncio.gather(this.source.stats(), this.replica.stats())
+        lows = [stats[1] for stats in (sourceStats, replicaStats) if stats[0]]
+        highs = [stats[2] for stats in (sourceStats, replicaStats) if stats[0]]
+        if not lows:
+            return ReconcileResult(0, 0, 0, 0, 0, time.perf_counter() - started)
+
+        # Chunks hold chunkSize rows on average, user IDs are snowflakes so they are spread fairly evenly
+        low, high = min(lows), max(highs)
+        chunkCount = max(1, math.ceil(max(sourceStats[0], replicaStats[0]) / this.chunkSize))
+        width = (high - low) // chunkCount + 1
+
+        sourceDigests, replicaDigests = await asyncio.gather(this.source.chunkDigests(low, width), this.replica.chunkDigests(low, width))
+        differing = sorted(chunk for chunk in sourceDigests.keys() | replicaDigests.keys() if sourceDigests.get(chunk) != replicaDigests.get(chunk))
+
+        upserts: list[TimezoneRow] = []
+        deletes: list[int] = []
+        for chunk in differing:
+            start = low + chunk * width
+            end = start + width
+            sourceRows, replicaRows = await asyncio.gather(this.source.fetchRange(start, end), this.replica.fetchRange(start, end))
+            upserts.extend(row for userId, row in sourceRows.items() if replicaRows.get(userId) != row)
+            deletes.extend(userId for userId in replicaRows if userId not in sourceRows)
+
+        # Deletes first, they free up aliases and uuids the upserts may need. A conflict can also clear up once a later row moved.
+        if deletes:
+            await this.replica.delete(deletes)
+        repairs = len(upserts)
+        for _ in range(2):
+            upserts = [row for row in upserts if not await this.replica.upsert(row)]
+            if not upserts:
+                break
+
+        for row in upserts:
+            Logger.error(f"Could not repair user {row[0]}, it conflicts with another row in the replica")
+
+        return ReconcileResult(
+            len(sourceDigests.keys() | replicaDigests.keys()),
+            len(differing),
+            repairs - len(upserts),
+            len(deletes),
+            len(upserts),
+            time.perf_counter() - started,
+        )
@@ -0,0 +1,134 @@
+import asyncio
+import contextlib
+import json
+import time
+from typing import TYPE_CHECKING, Final
+
+import aiomysql
+
+from config.Config import DatabaseConfig, MariaDBConfig
+from database.Migrations import Migrations
+from shell.Logger import Logger
+
+if TYPE_CHECKING:
+    from database.DataDatabase import Database
+
+
+class MariaDBReplicator:
+    """
+    Drains the SQLite replication_outbox table to MariaDB. Rows are only deleted once MariaDB committed them, so an outage
+    or a restart just resumes from the oldest row. Every replicated statement is an upsert or update, replaying one is harmless.
+    """
+
+    IDLE_POLL_INTERVAL: Final[float] = 5.0
+    MIN_BACKOFF: Final[float] = 1.0
+
+    def __init__(this, database: "Database", mdbConfig: MariaDBConfig, dbConfig: DatabaseConfig) -> None:
+        this.database = database
+        this.mdbConfig = mdbConfig
+        this.dbConfig = dbConfig
+
+        this.pool: aiomysql.Pool | None = None
+        this.wakeUp = asyncio.Event()
+        this.task: asyncio.Task | None = None
+
+        this.pending = 0
+        this.oldestPending: float | None = None
+        this.replicated = 0
+        this.failures = 0
+
+    def start(this) -> None:
+        this.task = asyncio.create_task(this.run())
+
+    def notify(this) -> None:
+        this.wakeUp.set()
+
+    async def close(this) -> None:
+        if this.task:
+            this.task.cancel()
+        if this.pool:
+            this.pool.close()
+            await this.pool.wait_closed()
+
+    async def connect(this) -> aiomysql.Pool:
+        pool = await aiomysql.create_pool(loop=asyncio.get_running_loop(), **this.mdbConfig.to_connection_params())
+        try:
+            await Migrations.migrateMariaDB(pool)
+        except BaseException:
+            pool.close()
+            await pool.wait_closed()
+            raise
+
+        Logger.success("Connected to MDB, replicating.")
+        return pool
+
+    async def getPool(this) -> aiomysql.Pool:
+        if not this.pool:
+            this.pool = await this.connect()
+        return this.pool
+
+    async def dropPool(this) -> None:
+        """Closes the pool so the next attempt reconnects, once a reconcile that may be using it is done."""
+        async with this.database.reconcileLock:
+            pool, this.pool = this.pool, None
+            if pool:
+                pool.close()
+                await pool.wait_closed()
+
+    async def run(this) -> None:
+        backoff = this.MIN_BACKOFF
+        while True:
+            try:
+                await this.refreshBacklog()
+                if not this.pending:
+                    this.wakeUp.clear()
+                    with contextlib.suppress(TimeoutError):
+                        await asyncio.wait_for(this.wakeUp.wait(), this.IDLE_POLL_INTERVAL)
+                    continue
+
+                await this.getPool()
+                # Paused while reconciling, the reconciler repairs from a snapshot and must not race newer writes.
+                # Whatever piles up in the outbox meanwhile is replayed afterwards.
+                async with this.database.reconcileLock:
+                    await this.replicateBatch()
+                backoff = this.MIN_BACKOFF
+
+            except Exception as e:  # noqa: BLE001
+                this.failures += 1
+                Logger.warning(f"MDB replication failed, {this.pending} writes pending, retrying in {backoff:g}s: {e!s}")
+                await this.dropPool()
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, this.dbConfig.replicationMaxBackoff)
+
+    async def refreshBacklog(this) -> None:
+        this.pending, this.oldestPending = await this.database.executeGetRowQuery("SELECT COUNT(*), MIN(createdAt) FROM replication_outbox", ())
+
+    async def replicateBatch(this) -> None:
+        query = "SELECT id, query, params FROM replication_outbox ORDER BY id LIMIT ?"
+        rows = await this.database.executeGetRowsQuery(query, (this.dbConfig.replicationBatchSize,))
+        if not rows:
+            return
+
+        async with this.pool.acquire() as conn, conn.cursor() as cur:
+            await conn.begin()
+            for rowId, mdbQuery, params in rows:
+                await cur.execute("SAVEPOINT outbox")
+                try:
+                    await cur.execute(mdbQuery, tuple(json.loads(params)))
+                except aiomysql.IntegrityError as e:
+                    # Retrying can't fix a constraint violation, the row would block replication forever
+                    await cur.execute("ROLLBACK TO SAVEPOINT outbox")
+                    Logger.error(f"MDB rejected replicated write {rowId}, dropping it: {e!s}")
+            await conn.commit()
+
+        await this.database.queueWrite("DELETE FROM replication_outbox WHERE id <= ?", (rows[-1][0],))
+        this.replicated += len(rows)
+
+    def getMetrics(this) -> dict[str, object]:
+        return {
+            "connected": this.pool is not None,
+            "pending": this.pending,
+            "lagSeconds": round(time.time() - this.oldestPending, 3) if this.pending and this.oldestPending else 0.0,
+            "replicated": this.replicated,
+            "failures": this.failures,
+        }
@@ -0,0 +1,65 @@
+import sys
+
+import aiosqlite
+
+from shared.Helpers import Helpers
+
+
+class TimezoneIndex:
+    """
+    The whole timezones table held in memory: user -> (timezone, uuid, alias) and uuid -> user. Timezone names are
+    interned, there are only a few hundred of them. Costs about 30 MB per 100k rows with a uuid on every row and
+    about 19 MB without (see benchmarks/TimezoneIndexBenchmark.py). The writer keeps it in step with SQLite after each commit.
+    """
+
+    def __init__(this) -> None:
+        this.users: dict[int, tuple[str, Helpers.UUIDStr | None, str | None]] = {}
+        this.uuids: dict[Helpers.UUIDStr, int] = {}
+
+    async def load(this, conn: aiosqlite.Connection) -> None:
+        cursor = await conn.execute("SELECT user, timezone, uuid, alias FROM timezones")
+        users: dict[int, tuple[str, Helpers.UUIDStr | None, str | None]] = {}
+        uuids: dict[Helpers.UUIDStr, int] = {}
+        async for userId, timezone, uuid, alias in cursor:
+            users[userId] = (sys.intern(timezone), uuid, alias)
+            if uuid:
+                uuids[uuid] = userId
+
+        this.users, this.uuids = users, uuids
+
+    def __len__(this) -> int:
+        return len(this.users)
+
+    def getTimezone(this, userId: int) -> str | None:
+        if row := this.users.get(userId):
+            return row[0]
+        return None
+
+    def getUUID(this, userId: int) -> Helpers.UUIDStr | None:
+        if row := this.users.get(userId):
+            return row[1]
+        return None
+
+    def getUserId(this, uuid: Helpers.UUIDStr) -> int | None:
+        return this.uuids.get(uuid)
+
+    def setTimezone(this, userId: int, timezone: str, alias: str) -> None:
+        _, uuid, _ = this.users.get(userId, (None, None, None))
+        this.users[userId] = (sys.intern(timezone), uuid, alias)
+
+    def setAlias(this, userId: int, alias: str) -> None:
+        if row := this.users.get(userId):
+            this.users[userId] = (row[0], row[1], alias)
+
+    def assignUUID(this, userId: int, uuid: Helpers.UUIDStr, timezone: str) -> None:
+        # Mirrors the upsert: a new row takes the uuid as its alias, an existing one only changes its uuid
+        timezone, previousUUID, alias = this.users.get(userId, (sys.intern(timezone), None, uuid))
+        if previousUUID:
+            this.uuids.pop(previousUUID, None)
+        this.users[userId] = (timezone, uuid, alias)
+        this.uuids[uuid] = userId
+
+    def unassignUUID(this, userId: int) -> None:
+        if (row := this.users.get(userId)) and row[1]:
+            this.uuids.pop(row[1], None)
+            this.users[userId] = (row[0], None, row[2])
@@ -3,6 +3,7 @@ import datetime
 import functools
 import inspect
 import json
+import os
 from pathlib import Path
 from typing import Final
 
@@ -47,17 +48,70 @@ def collectCommandStats(func: Callable[P, Coroutine[Any, Any, bool]]) -> Callabl
 class StatsDatabase:
     STATS_DIR: Final[Path] = Path("stats/")
 
-    def __init__(this) -> None:
+    def __init__(this, flushInterval: float = 30.0) -> None:
+        this.flushInterval = flushInterval
+        this.flushLock = asyncio.Lock()
+        this.dirty = False
+
+        this.currentStatsData: StatsData = StatsData()
+        this.currentHourFile: Path | None = None
+
         this.STATS_DIR.mkdir(parents=True, exist_ok=True)
-        asyncio.create_task(this.rotateCurrentDateFile())
+        this.rotateTask = asyncio.create_task(this.rotateCurrentDateFile())
+        this.flushTask = asyncio.create_task(this.flushPeriodically())
+
+    @staticmethod
+    def writeAtomically(file: Path, content: str) -> None:
+        tempFile = file.with_name(f".{file.name}.tmp")
+        with tempFile.open("w") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+        tempFile.replace(file)
 
     async def getCurrentDateFile(this) -> None:
         now = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
-        this.currentStatsData, this.currentHourFile, _ = await StatsData.loadStatsAtDate(now)
+        async with this.flushLock:
+            statsData, hourFile, _ = await StatsData.loadStatsAtDate(now)
+            if hourFile == this.currentHourFile:
+                return
+
+            # Swap without yielding in between, so no counter bump lands in the old hour after its snapshot was taken.
+            previousFile, previousContent, previousDirty = this.currentHourFile, json.dumps(this.currentStatsData.__dict__), this.dirty
+            this.currentStatsData, this.currentHourFile, this.dirty = statsData, hourFile, False
+
+            if previousFile and previousDirty:
+                await asyncio.to_thread(this.writeAtomically, previousFile, previousContent)
 
     async def dumpCurrent(this) -> None:
-        with this.currentHourFile.open("w") as file:
-            file.write(json.dumps(this.currentStatsData.__dict__))
+        async with this.flushLock:
+            if not this.currentHourFile:
+                return
+
+            content = json.dumps(this.currentStatsData.__dict__)
+            this.dirty = False
+            try:
+                await asyncio.to_thread(this.writeAtomically, this.currentHourFile, content)
+            except OSError:
+                this.dirty = True
+                raise
+
+    async def flushPeriodically(this) -> None:
+        while True:
+            await asyncio.sleep(this.flushInterval)
+            if not this.dirty:
+                continue
+
+            try:
+                await this.dumpCurrent()
+            except OSError as e:
+                Logger.error(f"Error thrown while flushing statistics: {e!s}")
+
+    async def close(this) -> None:
+        this.rotateTask.cancel()
+        this.flushTask.cancel()
+        await this.dumpCurrent()
 
     async def rotateCurrentDateFile(this) -> None:
         while True:
@@ -76,43 +130,43 @@ class StatsDatabase:
 
     async def addSuccessfulRequest(this) -> None:
         this.currentStatsData.successfulRequestCount += 1
-        await this.dumpCurrent()
+        this.dirty = True
 
-    async def addFailedRequest(this) -> None:
-        this.currentStatsData.failedRequestCount += 1
-        await this.dumpCurrent()
+    async def addFailedRequest(this, count: int = 1) -> None:
+        this.currentStatsData.failedRequestCount += count
+        this.dirty = True
 
     async def addRequestCountry(this, country: str) -> None:
         this.currentStatsData.requestCountries[country] = this.currentStatsData.requestCountries.get(country, 0) + 1
-        await this.dumpCurrent()
+        this.dirty = True
 
     async def addEstablishedKnownRequestType(this, requestType: str) -> None:
         this.currentStatsData.establishedKnownRequestTypes[requestType] = this.currentStatsData.establishedKnownRequestTypes.get(requestType, 0) + 1
-        await this.dumpCurrent()
+        this.dirty = True
 
     async def addProtocol(this, protocol: str) -> None:
         if protocol not in {"TCP", "UDP"}:
             return
 
         this.currentStatsData.protocols[protocol] = this.currentStatsData.protocols.get(protocol, 0) + 1
-        await this.dumpCurrent()
+        this.dirty = True
 
     async def addReceivedDataBandwidth(this, bytesDataSize: int) -> None:
         this.currentStatsData.receivedDataBandwidth += bytesDataSize
-        await this.dumpCurrent()
+        this.dirty = True
 
     async def addSentDataBandwidth(this, bytesDataSize: int) -> None:
         this.currentStatsData.sentDataBandwidth += bytesDataSize
-        await this.dumpCurrent()
+        this.dirty = True
 
     async def addSuccessfulCommandExecution(this) -> None:
         this.currentStatsData.successfulCommandExecutionCount += 1
-        await this.dumpCurrent()
+        this.dirty = True
 
     async def addFailedCommandExecution(this) -> None:
         this.currentStatsData.failedCommandExecutionCount += 1
-        await this.dumpCurrent()
+        this.dirty = True
 
     async def addRanCommandName(this, commandName: str) -> None:
         this.currentStatsData.ranCommandNames[commandName] = this.currentStatsData.ranCommandNames.get(commandName, 0) + 1
-        await this.dumpCurrent()
\ No newline at end of file
+        this.dirty = True
@@ -4,23 +4,25 @@ import copy
 import datetime
 import json
 import re
+import shutil
 import tarfile
 import time
 from copy import deepcopy
+from http import HTTPStatus
 from pathlib import Path
 from typing import Final, AsyncGenerator
 
+import aiofiles
 import discord
 import geoip2
 import maxminddb.errors
-from aiohttp import ClientSession, BasicAuth, ClientResponseError
+from aiohttp import ClientSession, BasicAuth, ClientError, ClientResponseError
 from discord import ExtensionAlreadyLoaded, ExtensionFailed, ExtensionNotFound, ExtensionNotLoaded, NoEntryPointError, \
     User, Option, SlashCommand
 from discord.ext import bridge
 from discord.ext.bridge import BridgeSlashCommand
 from discord.ext.commands import errors
 from geoip2 import database  # noqa: F401
-from six import BytesIO
 
 from config.Config import Config
 from database.APIKeyDatabase import ApiKeyDatabase
@@ -29,7 +31,10 @@ from database.stats.StatsDatabase import StatsDatabase
 from modules.helplib.Command import Command
 from server.APIServer import APIServer
 from server.ServerLogger import ServerLogger
+from shared.GeoIP import GeoIPResolver
+from shared.GeoIPTable import GeoIPTable
 from shared.Helpers import Helpers
+from shared.UsernameResolver import UsernameResolver
 from shell.Logger import Logger
 from typing import Literal
 
@@ -51,10 +56,12 @@ class TZBot(bridge.Bot):
     API_SERVER: Final[APIServer]
     API_SERVER_TASK: Final[asyncio.Task]
     API_PACKET_LOGGER: Final[ServerLogger]
+    geoIpRefreshTask: asyncio.Task
 
     GEO_IP_DB_FILE: Final[Path] = Path("state/GeoLite2-City.mmdb")
-    GEO_IP_URL: Final[str] = "https://download.maxmind.com/geoip/databases/GeoLite2-City/download?suffix=tar.gz"
-    DAY_SECONDS: Final[int] = 86_400
+    GEO_IP_TABLE_DIR: Final[Path] = Path("state/GeoIPTable")
+    GEO_IP_RETRY_INTERVAL: Final[float] = 300.0
+    DOWNLOAD_CHUNK_SIZE: Final[int] = 1 << 16
 
     type Headers = dict[str, str]
 
@@ -84,19 +91,21 @@ class TZBot(bridge.Bot):
 
         this.ownerId = this.config.ownerId
         this.linkCodes: dict[str, tuple[str, str]] = {}
-        this.db: Database = Database(this.config.mariadbDetails)
-        this.apiDb = ApiKeyDatabase(this.config.server.apiKeysKey)
+        this.usernames = UsernameResolver(this, this.config.server.usernameCacheSize, this.config.server.usernameCacheTtl)
+        this.db: Database = Database(this.config.mariadbDetails, this.config.database)
+        this.apiDb = ApiKeyDatabase(this.config.server.apiKeysKey, this.config.database.readerPoolSize)
         if not this.GEO_IP_DB_FILE.parent.exists():
             this.GEO_IP_DB_FILE.parent.mkdir(exist_ok=True)
         if not this.GEO_IP_DB_FILE.exists():
             this.GEO_IP_DB_FILE.touch(exist_ok=True)
+        this.geoIp = GeoIPResolver(this.config.server.geoIpCacheSize)
         try:
-            this.maxMindDb: geoip2.database.Reader = geoip2.database.Reader(this.GEO_IP_DB_FILE)
+            this.geoIp.swap(geoip2.database.Reader(this.GEO_IP_DB_FILE, mode=maxminddb.MODE_MMAP_EXT))
         except maxminddb.errors.InvalidDatabaseError:
             Logger.error("MaxMind DB is invalid, will fetch")
             this.syncOverride = True
 
-        this.statsDb: Final[StatsDatabase] = StatsDatabase()
+        this.statsDb: Final[StatsDatabase] = StatsDatabase(this.config.stats.flushInterval)
 
         if not this.DIALOG_OWNERS_FILE.exists():
             this.DIALOG_OWNERS_FILE.touch()
@@ -147,7 +156,7 @@ class TZBot(bridge.Bot):
         try:
             async with this.getNewClient(contentTypes) as session:
                 async with session.get(url) as response:
-                    if response.status == 200 and response.content_type in contentTypes:
+                    if response.status == HTTPStatus.OK and response.content_type in contentTypes:
                         Logger.success("Download was successful!")
                         return response.content_type, await response.read()
 
@@ -159,60 +168,140 @@ class TZBot(bridge.Bot):
             Logger.error(f"Download failed!")
             Logger.error(e)
 
-    async def syncGeoIP(this):
-        if not this.syncOverride:
-            if this.GEO_IP_DB_FILE.is_file():
-                currentTime = time.time()
-                secondsDiff = currentTime - this.GEO_IP_DB_FILE.stat().st_ctime
-                if secondsDiff < this.DAY_SECONDS:
-                    Logger.log("Skipping GeoLite2 database download, it was updated less than 24 hours ago.")
-                    return
+    async def syncGeoIP(this) -> bool:
+        """
+        Downloads a fresh GeoLite2 database if ours is older than the refresh interval. The archive is streamed to disk and
+        extracted off the event loop, the new file replaces the old one with a rename so the open reader keeps its mapping.
+        """
+        if not this.syncOverride and this.GEO_IP_DB_FILE.is_file():
+            secondsDiff = time.time() - this.GEO_IP_DB_FILE.stat().st_mtime
+            if secondsDiff < this.config.maxmind.refreshInterval:
+                Logger.log("Skipping GeoLite2 database download, it was updated recently.")
+                return False
 
         Logger.log("Downloading GeoLite2 database...")
-        async with this.getNewClient({"application/tar", "application/tar+gzip"}) as session:
-            async with session.get(this.GEO_IP_URL, auth=BasicAuth(str(this.config.maxmind.accountId), this.config.maxmind.token, "utf-8")) as response:
-                if response.status == 200:
-                    tarArchiveRaw = BytesIO(await response.read())
-                else:
+        archive = this.GEO_IP_DB_FILE.with_name(f"{this.GEO_IP_DB_FILE.name}.tar.gz.part")
+        try:
+            auth = BasicAuth(str(this.config.maxmind.accountId), this.config.maxmind.token, "utf-8")
+            async with this.getNewClient({"application/tar", "application/tar+gzip"}) as session, \
+                    session.get(this.config.maxmind.downloadUrl, auth=auth) as response:
+                if response.status != HTTPStatus.OK:
                     Logger.error(f"GeoIP failed! Content type: {response.content_type}; Code: {response.status}")
+                    return False
 
-        mmdb: bytes | None = None
-        with tarfile.open(fileobj=tarArchiveRaw, mode="r:*") as tar:
-            for member in tar:
-                if member.isfile() and member.name.endswith("GeoLite2-City.mmdb"):
-                    extracted = tar.extractfile(member)
-                    if extracted:
-                        mmdb = extracted.read()
-                    break
+                async with aiofiles.open(archive, "wb") as f:
+                    async for chunk in response.content.iter_chunked(this.DOWNLOAD_CHUNK_SIZE):
+                        await f.write(chunk)
 
-        if not mmdb:
-            Logger.error("Failed to find the database file in the TAR.")
-            return
+            reader = await asyncio.to_thread(this.extractGeoIP, archive)
+        except (ClientError, OSError, tarfile.TarError, maxminddb.errors.InvalidDatabaseError) as e:
+            Logger.error(f"GeoIP update failed: {e!s}")
+            return False
+        finally:
+            archive.unlink(missing_ok=True)
 
-        with this.GEO_IP_DB_FILE.open("wb") as f:
-            f.write(mmdb)
+        if not reader:
+            Logger.error("Failed to find the database file in the TAR.")
+            return False
 
-        this.maxMindDb = geoip2.database.Reader(this.GEO_IP_DB_FILE)
+        this.geoIp.swap(reader)
+        this.syncOverride = False
         Logger.success("Fresh GeoIP database fetched!")
+        return True
+
+    def extractGeoIP(this, archive: Path) -> geoip2.database.Reader | None:
+        """Extracts the database next to the live one, opens it to make sure it's valid and only then renames it over the live one."""
+        extracted = this.GEO_IP_DB_FILE.with_name(f"{this.GEO_IP_DB_FILE.name}.tmp")
+        with tarfile.open(archive, mode="r:*") as tar:
+            member = next((member for member in tar if member.isfile() and member.name.endswith("GeoLite2-City.mmdb")), None)
+            if not member:
+                return None
+
+            with tar.extractfile(member) as source, extracted.open("wb") as target:
+                shutil.copyfileobj(source, target, this.DOWNLOAD_CHUNK_SIZE)
+
+        try:
+            reader = geoip2.database.Reader(extracted, mode=maxminddb.MODE_MMAP_EXT)
+        except BaseException:
+            extracted.unlink(missing_ok=True)
+            raise
+
+        extracted.replace(this.GEO_IP_DB_FILE)
+        return reader
+
+    async def refreshGeoIPPeriodically(this) -> None:
+        while True:
+            try:
+                if await this.syncGeoIP() or not this.geoIp.table:
+                    await this.refreshGeoIPTable()
+            except Exception as e:  # noqa: BLE001
+                # Anything unexpected must not end the refresh for the rest of the process
+                Logger.error(f"GeoIP refresh failed: {e!s}")
+                await asyncio.sleep(this.GEO_IP_RETRY_INTERVAL)
+                continue
+
+            # Without any database yet, a failed download is retried sooner
+            await asyncio.sleep(this.config.maxmind.refreshInterval if this.geoIp.reader else this.GEO_IP_RETRY_INTERVAL)
+
+    async def refreshGeoIPTable(this) -> None:
+        """Loads the flattened GeoIP table, rebuilding it first if it was built from another database than the one loaded."""
+        if not this.geoIp.reader:
+            return
+
+        buildEpoch = this.geoIp.reader.metadata().build_epoch
+        table = GeoIPTable.load(this.GEO_IP_TABLE_DIR)
+        if not table or table.buildEpoch != buildEpoch:
+            Logger.log("Building the GeoIP range table...")
+            try:
+                table = await asyncio.to_thread(this.buildGeoIPTable)
+            except (OSError, ValueError, maxminddb.errors.InvalidDatabaseError) as e:
+                Logger.error(f"Could not build the GeoIP range table: {e!s}")
+                return
+            if not table:
+                Logger.error("The GeoIP range table was built but could not be loaded.")
+                return
+
+        this.geoIp.swapTable(table)
+        Logger.success(f"GeoIP range table loaded, {len(table.v4Starts)} IPv4 and {len(table.v6Starts)} IPv6 ranges.")
+
+    def buildGeoIPTable(this) -> GeoIPTable:
+        GeoIPTable.build(this.GEO_IP_DB_FILE).save(this.GEO_IP_TABLE_DIR)
+        return GeoIPTable.load(this.GEO_IP_TABLE_DIR)
+
+    def getMetrics(this) -> dict[str, object]:
+        usernames = {f"discord.usernames.{key}": value for key, value in this.usernames.getMetrics().items()}
+        geoIp = {f"geoip.{key}": value for key, value in this.geoIp.getMetrics().items()}
+        return {**this.db.getMetrics(), **this.API_SERVER.getMetrics(), **usernames, **geoIp}
 
     # WSS shit
     async def startRunning(this) -> None:
+        await this.db.initTask
         this.API_SERVER_TASK = asyncio.create_task(this.API_SERVER.start())
+        this.geoIpRefreshTask = asyncio.create_task(this.refreshGeoIPPeriodically())
         await this.start(this.config.token)
 
     async def stopRunning(this):
         await this.close()
 
     async def stop(this):
+        this.geoIpRefreshTask.cancel()
         await this.API_SERVER.stop()
         await this.stopRunning()
         await this.API_SERVER_TASK
+        await this.statsDb.close()
+        await this.db.close()
+        await this.apiDb.close()
 
     async def on_connect(this) -> None:
-        await this.syncGeoIP()
         await this.loadCogs()
         await this.sync_commands()
 
+    async def on_user_update(this, before: discord.User, after: discord.User) -> None:  # noqa: ARG002
+        this.usernames.invalidate(after.id)
+
+    async def on_member_update(this, before: discord.Member, after: discord.Member) -> None:  # noqa: ARG002
+        this.usernames.invalidate(after.id)
+
     async def on_application_command_error(this, ctx: discord.Interaction, error: discord.DiscordException) -> bool:
         embed = await this.getFail(description="There was an error with the command's execution.", user=ctx.user)
         await ctx.response.send_message(embed=embed, ephemeral=True)
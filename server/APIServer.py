@@ -1,19 +1,21 @@
 import asyncio
-import json
 import struct
-from asyncio import Server, IncompleteReadError
-from json import JSONDecodeError
-from typing import Final, TypedDict, NotRequired
+from asyncio import Server
+from typing import Final
 
 from cryptography.exceptions import InvalidTag
 
 from server.protocol.APIPayload import APIPayload, PacketFlags
+from server.protocol.Codec import CodecError, codecFor
 from server.protocol.Client import Client
-from server.protocol.TCP import TCPClient
+from server.protocol.TCP import TCPClient, TCPProtocol
 from server.protocol.UDP import UDPProtocol
-from server.requests.AbstractRequests import SimpleRequest, RequestDataPayload, RequestHeaders
+from server.RejectionTracker import RejectionReason, RejectionTracker, RequestRejectedError
+from server.ServerError import ErrorCode
+from server.requests.AbstractRequests import SimpleRequest
 from server.requests.Requests import PingRequest, TimeZoneRequest, TimeZoneFromIPRequest, UserIdUUIDLinkPost, \
-    TimezoneFromUUIDRequest, IsLinkedRequest, UserIDFromUUIDRequest, UUIDFromUserIDRequest
+    TimezoneFromUUIDRequest, IsLinkedRequest, UserIDFromUUIDRequest, UUIDFromUserIDRequest, BatchRequest, \
+    TimezonesFromUserIdsRequest, TimezonesFromUUIDsRequest
 from shared.Helpers import Helpers
 from shell.Logger import Logger
 
@@ -31,7 +33,10 @@ class APIServer:
         TimezoneFromUUIDRequest,
         IsLinkedRequest,
         UserIDFromUUIDRequest,
-        UUIDFromUserIDRequest
+        UUIDFromUserIDRequest,
+        BatchRequest,
+        TimezonesFromUserIdsRequest,
+        TimezonesFromUUIDsRequest
     ]
 
     transport: asyncio.DatagramTransport
@@ -42,6 +47,8 @@ class APIServer:
         this.serverConfig = tzBot.config.server
         this.aesKey: bytes = this.serverConfig.aesKey.encode()
         this._STOP_EVENT = asyncio.Event()
+        this.rejections = RejectionTracker(tzBot.statsDb, this.serverConfig.rejectionLogInterval)
+        this.UDP_SERVER = UDPProtocol(this)
 
     def getRequestType(this, index: int) -> type[SimpleRequest]:
         try:
@@ -49,19 +56,22 @@ class APIServer:
         except IndexError:
             return SimpleRequest
 
+    def getMetrics(this) -> dict[str, object]:
+        return {**this.rejections.getMetrics(), **this.UDP_SERVER.getMetrics()}
 
     async def start(this) -> None:
-        this.TCP_SERVER = await asyncio.start_server(this.TCPReceived, "0.0.0.0", int(this.serverConfig.port))
-        this.UDP_SERVER = UDPProtocol(this)
-
         loop = asyncio.get_running_loop()
+        this.TCP_SERVER = await loop.create_server(lambda: TCPProtocol(this), "0.0.0.0", int(this.serverConfig.port))
         transport, *_ = await loop.create_datagram_endpoint(lambda: this.UDP_SERVER, local_addr=("0.0.0.0", int(this.serverConfig.port)))
         this.transport = transport
+        rejectionTask = asyncio.create_task(this.rejections.run())
 
         Logger.success("Server running!")
         try:
             await this._STOP_EVENT.wait()
         finally:
+            rejectionTask.cancel()
+            await this.rejections.flush()
             Logger.log("Server shutting down!")
 
     async def stop(this):
@@ -69,99 +79,98 @@ class APIServer:
         this.UDP_SERVER.close()
         this._STOP_EVENT.set()
 
-    async def TCPReceived(this, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
-        client: TCPClient = TCPClient(reader, writer, this.aesKey, this)
-        try:
-            magic = await reader.readexactly(2)
-            if magic != b"tz":
-                rest = magic + await reader.read(65535)
-                await this.respondToInvalid(rest, client)
-                return
-
-            headerLen = int.from_bytes(await reader.readexactly(1), "big")
-            rest = await reader.readexactly(headerLen)
-
-            header = magic + headerLen.to_bytes(1, "big") + rest
-
-            if len(header) < 7:
-                writer.close()
-                return
+    def parsePacketInfo(this, msg: bytes | memoryview) -> APIPayload | None:
+        tLetter, zLetter, *payload = struct.unpack_from(">BBBBBH", msg)
+        if tLetter != ord("t") or zLetter != ord("z") or len(payload) != 4:
+            return None
+        if payload[0] < APIPayload.HEADER_LEN or payload[-1] + payload[0] > len(msg):
+            return None
 
-            bodyLen = int.from_bytes(header[5:7], "big")
-            body = await reader.readexactly(bodyLen)
+        requestId = None
+        if payload[2] & PacketFlags.SESSION:
+            if payload[0] < APIPayload.SESSION_HEADER_LEN:
+                return None
+            requestId = int.from_bytes(msg[APIPayload.HEADER_LEN:APIPayload.SESSION_HEADER_LEN], "big")
 
-            msg = header + body
+        return APIPayload.fromTuple(payload, requestId)
 
-            client: TCPClient = TCPClient(reader, writer, this.aesKey, this)
-            await this.processRequest(msg, client)
-        except IncompleteReadError as e:
-            Logger.error(f"Didn't get enough bytes to check for header! {e!s}")
-            writer.close()
+    async def reject(this, reason: RejectionReason, msg: bytes, client: Client) -> None:
+        # UDP rejections are dropped, answering spoofed sources would only reflect traffic at them.
+        if isinstance(client, TCPClient):
+            this.rejections.record(reason, "TCP", client.ip.address, msg)
+            client.flags = 0
+            await client.send(ErrorCode.BAD_REQUEST)
+        else:
+            this.rejections.record(reason, "UDP", client.ip.address, msg)
 
-    async def parsePacketInfo(this, msg: bytes) -> APIPayload | None:
-        tLetter, zLetter, *payload = struct.unpack(">BBBBBH", msg[0:7])
-        if tLetter != ord("t") or zLetter != ord("z") or len(payload) != 4 or payload[0] < 7 or payload[-1] + payload[0] > len(msg):
-            return None
+    async def recordTraffic(this, size: int, protocol: str) -> None:
+        await this.tzBot.statsDb.addReceivedDataBandwidth(size)
+        await this.tzBot.statsDb.addProtocol(protocol)
 
-        return APIPayload.fromTuple(payload)
+    async def processRequest(this, msg: bytes, client: Client) -> None:
+        await this.recordTraffic(len(msg), "TCP" if isinstance(client, TCPClient) else "UDP")
 
-class JsonPacketEnvelope(TypedDict):
-    requestType: int | str
-    data: RequestDataPayload
-    headers: NotRequired[RequestHeaders]
+        if this.shouldOffload(msg):
+            await this.processOffloaded(msg, client)
+            return
 
+        try:
+            reqType, headers, data = this.decodeRequest(msg, client)
+        except RequestRejectedError as e:
+            await this.reject(e.reason, msg, client)
+            return
 
-    async def respondToInvalid(this, msg: str | bytes, client: Client):
-        if isinstance(client, TCPClient):
-            protocol = "TCP"
-        else:
-            protocol = "UDP"
+        await this.dispatchRequest(reqType, headers, data, client)
 
-        # [SAFETY] Safely decode bytes; prevent JSON serialization crash
-        safe_msg: str = msg.decode('utf-8', errors='replace') if isinstance(msg, bytes) else msg
+    def shouldOffload(this, msg: bytes | memoryview) -> bool:
+        # A small gzip payload can still inflate to maxInflatedSize, it's only known once inflated
+        if len(msg) > this.serverConfig.offloadThreshold:
+            return True
+        return len(msg) > APIPayload.FLAGS_OFFSET and bool(msg[APIPayload.FLAGS_OFFSET] & PacketFlags.GUNZIP)
 
-        Logger.log(f"Got an invalid {protocol} request: {safe_msg}")
-        
-        fakeJson: JsonPacketEnvelope = {
-            "requestType": "INVALID",
-            "data": {"message": safe_msg}
-        }
+    async def processOffloaded(this, msg: bytes, client: Client) -> None:
+        """For large or compressed payloads, decryption and decompression run in a thread, both release the GIL."""
+        try:
+            reqType, payload, header, content = this.parseRequest(msg, client)
+            content, appliedFlags = await asyncio.to_thread(this.unwrapContent, payload, header, content)
+            reqType, headers, data = this.decodeContent(reqType, payload, content, appliedFlags, client)
+        except RequestRejectedError as e:
+            await this.reject(e.reason, msg, client)
+            return
 
-        # Extract data, explicitly typed as BaseData (compatible with RequestDataPayload)
-        fakeData = fakeJson["data"]
+        await this.dispatchRequest(reqType, headers, data, client)
 
-        request = SimpleRequest(client, {}, fakeData, this.tzBot)
-        await request.process()
-        return
+    def decodeRequest(this, msg: bytes | memoryview, client: Client) -> tuple[type[SimpleRequest], dict, dict]:
+        """Synchronous so TCP frames can be decoded straight out of the connection buffer, raises RequestRejectedError."""
+        reqType, payload, header, content = this.parseRequest(msg, client)
+        content, appliedFlags = this.unwrapContent(payload, header, content)
+        return this.decodeContent(reqType, payload, content, appliedFlags, client)
 
-    async def processRequest(this, msg: bytes, client: Client) -> None:
-        await this.tzBot.statsDb.addReceivedDataBandwidth(len(msg))
+    def parseRequest(this, msg: bytes | memoryview, client: Client) -> tuple[type[SimpleRequest], APIPayload, bytes | memoryview, bytes | memoryview]:
+        if msg[:2] != b"tz":
+            raise RequestRejectedError(RejectionReason.BAD_MAGIC)
 
-        if isinstance(client, TCPClient):
-            protocol: str = "TCP"
-        else:
-            protocol: str = "UDP"
+        payload: APIPayload | None = this.parsePacketInfo(msg) if len(msg) >= APIPayload.HEADER_LEN else None
+        if not payload:
+            raise RequestRejectedError(RejectionReason.BAD_LENGTH)
 
-        await this.tzBot.statsDb.addProtocol(protocol)
+        client.requestId = payload.requestId
+        reqType: type[SimpleRequest] = this.getRequestType(payload.requestType)
+        if reqType == SimpleRequest:
+            raise RequestRejectedError(RejectionReason.UNKNOWN_TYPE)
 
-        payload: APIPayload | None = await this.parsePacketInfo(msg)
-        if not payload:
-            await this.respondToInvalid(msg, client)
-            return
+        # Process flags
+        if payload.flags & PacketFlags.AESGCM and payload.flags & PacketFlags.CHACHAPOLY:
+            raise RequestRejectedError(RejectionReason.BAD_FLAGS)
 
-        client.flags = payload.flags
         header = msg[:payload.dataOffset]
         content = msg[payload.dataOffset:payload.contentLen + payload.dataOffset]
+        return reqType, payload, header, content
 
+    def unwrapContent(this, payload: APIPayload, header: bytes | memoryview, content: bytes | memoryview) -> tuple[bytes | memoryview, list[str]]:
+        """Decryption and decompression, doesn't touch the event loop so it can run in a thread."""
         appliedFlags = []
 
-        # Process flags
-        if payload.flags & PacketFlags.AESGCM and payload.flags & PacketFlags.CHACHAPOLY:
-            Logger.error("Used more encryption algorithms!")
-            client.flags = 0
-            await this.respondToInvalid(content, client)
-            return
-
         try:
             if payload.flags & PacketFlags.AESGCM:
                 content = Helpers.AESDecrypt(content, this.aesKey, header)
@@ -174,47 +183,37 @@ class JsonPacketEnvelope(TypedDict):
             else:
                 appliedFlags.append("unencrypted")
 
-        except InvalidTag:
-            Logger.error("Request with invalid tag, rejecting!")
-            client.flags = 0
-            await this.respondToInvalid(content, client)
-            return
+        except (InvalidTag, ValueError) as e:
+            raise RequestRejectedError(RejectionReason.BAD_TAG) from e
 
         if payload.flags & PacketFlags.GUNZIP:
-            decompressed = Helpers.unGzip(content)
-            if not decompressed:
-                client.flags = 0
-                await this.respondToInvalid(msg, client)
-                return
-            content = decompressed
+            content = Helpers.unGzip(content, this.serverConfig.maxInflatedSize)
+            if not content:
+                raise RequestRejectedError(RejectionReason.BAD_COMPRESSION)
             appliedFlags.append("GZIPped")
 
-        if payload.flags & PacketFlags.MSGPACK:
-            unpacked = Helpers.msgpackToJson(content)
-            if not unpacked:
-                client.flags = 0
-                await this.respondToInvalid(msg, client)
-                return
-            content = unpacked
-            appliedFlags.append("MSGPack")
-        else:
-            appliedFlags.append("JSON")
+        return content, appliedFlags
+
+    def decodeContent(
+        this, reqType: type[SimpleRequest], payload: APIPayload, content: bytes | memoryview, appliedFlags: list[str], client: Client,
+    ) -> tuple[type[SimpleRequest], dict, dict]:
+        codec = codecFor(payload.flags)
+        appliedFlags.append(codec.name)
 
         try:
-            jsonRequest: dict = json.loads(content.decode("utf-8", errors="ignore"))
-        except (JSONDecodeError, TypeError):
-            client.flags = 0
-            await this.respondToInvalid(content, client)
-            return
+            decoded = codec.decode(content)
+        except CodecError as e:
+            raise RequestRejectedError(RejectionReason.BAD_ENCODING) from e
 
-        reqType: type[SimpleRequest] = this.getRequestType(payload.requestType)
-        payload: dict = jsonRequest.pop("data", {})
+        if not isinstance(decoded, dict):
+            raise RequestRejectedError(RejectionReason.BAD_ENCODING)
+
+        client.flags = payload.flags
+        Logger.log(f"Got a known {"TCP" if isinstance(client, TCPClient) else "UDP"}, {", ".join(appliedFlags)} request: {decoded}")
+        return reqType, decoded, decoded.pop("data", {})
 
-        if reqType != SimpleRequest:
-            Logger.log(f"Got a known {protocol}, {", ".join(appliedFlags)} request: {content.decode()}")
-            request = reqType(client, jsonRequest, payload, this.tzBot)
-            await request.process()
+    async def dispatchRequest(this, reqType: type[SimpleRequest], headers: dict, data: dict, client: Client) -> None:
+        request = reqType(client, headers, data, this.tzBot)
+        await request.process()
 
-            await this.tzBot.statsDb.addEstablishedKnownRequestType(request.packetNameStringRepr())
-        else:
-            await this.respondToInvalid(content, client)
+        await this.tzBot.statsDb.addEstablishedKnownRequestType(request.packetNameStringRepr())
@@ -32,12 +32,19 @@ class ApiKey:
         this.validUntil = validUntil
         this.keyId = keyId
 
-    def hasPermissions(this, *permissions: ApiPermissions) -> bool:
-        required = ApiPermissions(0)
+    @staticmethod
+    def permissionMask(*permissions: ApiPermissions) -> int:
+        mask = 0
         for perm in permissions:
-            required |= perm
+            mask |= perm.value
+
+        return mask
+
+    def hasPermissions(this, *permissions: ApiPermissions) -> bool:
+        return this.hasPermissionMask(ApiKey.permissionMask(*permissions))
 
-        return (ApiPermissions(this.permissions) & required) == required
+    def hasPermissionMask(this, mask: int) -> bool:
+        return (this.permissions & mask) == mask
 
     def prettyPrintPerms(this) -> list[str]:
         return [flag.name for flag in ApiPermissions if ApiPermissions(this.permissions) & flag and flag.name]
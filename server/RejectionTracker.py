@@ -0,0 +1,75 @@
+import asyncio
+from collections import Counter
+from enum import StrEnum
+from typing import TYPE_CHECKING, Final
+
+from shell.Logger import Logger
+
+if TYPE_CHECKING:
+    from database.stats.StatsDatabase import StatsDatabase
+
+
+class RejectionReason(StrEnum):
+    BAD_MAGIC = "BAD_MAGIC"
+    BAD_LENGTH = "BAD_LENGTH"
+    BAD_FLAGS = "BAD_FLAGS"
+    BAD_TAG = "BAD_TAG"
+    BAD_COMPRESSION = "BAD_COMPRESSION"
+    BAD_ENCODING = "BAD_ENCODING"
+    UNKNOWN_TYPE = "UNKNOWN_TYPE"
+
+
+class RequestRejectedError(Exception):
+    def __init__(this, reason: RejectionReason) -> None:
+        super().__init__(reason)
+        this.reason = reason
+
+
+class RejectionTracker:
+    """Counts rejected packets and logs a sampled summary once per interval instead of one log entry per packet."""
+
+    SAMPLE_SIZE: Final[int] = 5
+    SAMPLE_BYTES: Final[int] = 32
+    MAX_TRACKED_SOURCES: Final[int] = 1024
+
+    def __init__(this, statsDb: "StatsDatabase", logInterval: float) -> None:
+        this.statsDb = statsDb
+        this.logInterval = logInterval
+
+        this.totals: Counter[RejectionReason] = Counter()
+        this.window: Counter[tuple[str, RejectionReason]] = Counter()
+        this.sources: Counter[str] = Counter()
+        this.samples: list[str] = []
+
+    def record(this, reason: RejectionReason, protocol: str, address: str, msg: bytes) -> None:
+        this.totals[reason] += 1
+        this.window[protocol, reason] += 1
+
+        if address in this.sources or len(this.sources) < this.MAX_TRACKED_SOURCES:
+            this.sources[address] += 1
+
+        if len(this.samples) < this.SAMPLE_SIZE:
+            this.samples.append(f"{protocol} {address} {reason}: {bytes(msg[:this.SAMPLE_BYTES]).hex()}")
+
+    async def run(this) -> None:
+        while True:
+            await asyncio.sleep(this.logInterval)
+            await this.flush()
+
+    async def flush(this) -> None:
+        if not this.window:
+            return
+
+        window, sources, samples = this.window, this.sources, this.samples
+        this.window, this.sources, this.samples = Counter(), Counter(), []
+
+        await this.statsDb.addFailedRequest(window.total())
+
+        counts = ", ".join(f"{protocol} {reason}={count}" for (protocol, reason), count in window.most_common())
+        topSources = ", ".join(f"{address} ({count})" for address, count in sources.most_common(3))
+        Logger.warning(f"Rejected {window.total()} packets in the last {this.logInterval:g}s: {counts}; top sources: {topSources}")
+        for sample in samples:
+            Logger.warning(f"  sample: {sample}")
+
+    def getMetrics(this) -> dict[str, object]:
+        return {f"api.rejected.{reason}": this.totals[reason] for reason in RejectionReason}
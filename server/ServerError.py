@@ -1,19 +1,17 @@
-import copy
+from server.protocol.Response import ResponseTemplate
 
-from server.protocol.Response import Response
 
-
-class DeepCopier(type):
-    def __getattribute__(cls, name: str) -> object:
-        return copy.deepcopy(super().__getattribute__(name))
-
-
-class ErrorCode(metaclass=DeepCopier):
-    OK = Response(200, "OK")
-    BAD_REQUEST = Response(400, "Bad Request")
-    FORBIDDEN = Response(403, "Forbidden")
-    NOT_FOUND = Response(404, "Not Found")
-    BAD_METHOD = Response(405, "Bad Method")
-    INTERNAL_SERVER_ERROR = Response(500, "Internal Server Error")
-    CONFLICT = Response(409, "Conflict")
-    BAD_GEOLOC = Response(-1, "Bad Geolocation")
\ No newline at end of file
+class ErrorCode:
+    OK = ResponseTemplate(200, "OK")
+    PONG = ResponseTemplate(200, "Pong")
+    BAD_REQUEST = ResponseTemplate(400, "Bad Request")
+    UNENCRYPTED = ResponseTemplate(400, "Bad Request, Unencrypted")
+    INVALID_UUID = ResponseTemplate(400, "Invalid UUID")
+    FORBIDDEN = ResponseTemplate(403, "Forbidden")
+    NOT_FOUND = ResponseTemplate(404, "Not Found")
+    BAD_METHOD = ResponseTemplate(405, "Bad Method")
+    INTERNAL_SERVER_ERROR = ResponseTemplate(500, "Internal Server Error")
+    CONFLICT = ResponseTemplate(409, "Conflict")
+    RESPONSE_TOO_LARGE = ResponseTemplate(413, "Response Too Large")
+    UUID_CONFLICT = ResponseTemplate(409, "UUID already registered")
+    BAD_GEOLOC = ResponseTemplate(-1, "Bad Geolocation")
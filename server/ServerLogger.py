@@ -8,7 +8,7 @@ import discord
 from server.ServerError import ErrorCode
 from server.protocol.APIPayload import PacketFlags
 from server.requests.AbstractRequests import SimpleRequest
-from server.requests.Requests import PingRequest, TimeZoneFromIPRequest, UserIdUUIDLinkPost
+from server.requests.Requests import PingRequest, TimeZoneFromIPRequest, UserIdUUIDLinkPost, BatchRequest
 from shared.Helpers import Helpers
 
 
@@ -30,7 +30,7 @@ class ServerLogger:
         fileSendList: list[discord.File] = []
 
         lock = "🔒" if request.client.flags & PacketFlags.AESGCM else ""
-        warning = "⚠️" if request.city and (request.response and request.response.code == ErrorCode.BAD_GEOLOC.code) else ""
+        warning = "⚠️" if request.geoLocation and (request.response and request.response.code == ErrorCode.BAD_GEOLOC.code) else ""
         if warning:
             request.response = None
 
@@ -38,7 +38,14 @@ class ServerLogger:
             request.data["ip"] = "<redacted>"
 
         if not warning and isinstance(request, UserIdUUIDLinkPost) and request.response.code == ErrorCode.OK.code:
-            request.response.message = "<redacted>"
+            request.response = request.response.withMessage("<redacted>")
+
+        if not warning and isinstance(request, BatchRequest) and request.response.code == ErrorCode.OK.code:
+            request.response = request.response.withMessage([
+                {**item, "message": "<redacted>"} if isinstance(subRequest, UserIdUUIDLinkPost) and item["code"] == ErrorCode.OK.code else item
+                # process() appends exactly one reply per sub-request, a length mismatch is a bug that must not mislabel what gets redacted
+                for subRequest, item in zip(request.subRequests, request.response.message, strict=True)
+            ])
 
         if len(str(request.data)) < this.MAX_DATA_EMBED_LEN:
             embed.add_field(name="Request Data", value=f"```{str(request.data).replace("'", "\"")}```", inline=False)
@@ -49,10 +56,10 @@ class ServerLogger:
 
         if request.response:
             if len(str(request.response)) < this.MAX_DATA_EMBED_LEN:
-                embed.add_field(name="Response Data", value=f"```{json.dumps(request.response.__dict__)}```", inline=False)
+                embed.add_field(name="Response Data", value=f"```{json.dumps(request.response.toDict())}```", inline=False)
             else:
                 embed.add_field(name="Response Data", value=f"Request is included in the file below due to its size.", inline=False)
-                responseFile = discord.File(io.BytesIO(json.dumps(request.response.__dict__).encode("utf-8")), "ResponseData.json")
+                responseFile = discord.File(io.BytesIO(json.dumps(request.response.toDict()).encode("utf-8")), "ResponseData.json")
                 fileSendList.append(responseFile)
 
 
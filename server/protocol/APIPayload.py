@@ -1,24 +1,34 @@
 from enum import IntEnum
-from typing import Self
+from typing import Final, Self
 
 class PacketFlags(IntEnum):
     AESGCM = 1 << 0
     CHACHAPOLY = 1 << 1
     GUNZIP = 1 << 2
     MSGPACK = 1 << 3
+    SESSION = 1 << 4
 
 class APIPayload:
+    # Pattern (2) + headerLen (1) + type (1) + flags (1) + contentLen (2), session mode appends a 4 byte requestId
+    HEADER_LEN_OFFSET: Final[int] = 2
+    FLAGS_OFFSET: Final[int] = 4
+    CONTENT_LEN_OFFSET: Final[int] = 5
+    HEADER_LEN: Final[int] = 7
+    SESSION_HEADER_LEN: Final[int] = HEADER_LEN + 4
+
     dataOffset: int
     requestType: int
     flags: PacketFlags
     contentLen: int
+    requestId: int | None
 
-    def __init__(this, dataOffset: int, requestType: int, flags: PacketFlags, contentLen: int) -> None:
+    def __init__(this, dataOffset: int, requestType: int, flags: PacketFlags, contentLen: int, requestId: int | None = None) -> None:
         this.dataOffset = dataOffset
         this.requestType = requestType
         this.flags = flags
         this.contentLen = contentLen
+        this.requestId = requestId
 
     @classmethod
-    def fromTuple(cls, apiPayload: tuple[int, int, int, int, int]) -> Self:
-        return cls(*apiPayload)
\ No newline at end of file
+    def fromTuple(cls, apiPayload: tuple[int, int, int, int], requestId: int | None = None) -> Self:
+        return cls(*apiPayload, requestId)
\ No newline at end of file
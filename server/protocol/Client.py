@@ -1,38 +1,72 @@
+import asyncio
+from typing import TYPE_CHECKING, Final
+
 from server.protocol.APIPayload import PacketFlags
 from server.protocol.IP import IP
+from server.ServerError import ErrorCode
 from shared.Helpers import Helpers
+from shell.Logger import Logger
+
+if TYPE_CHECKING:
+    from server.APIServer import APIServer
+    from server.protocol.Response import Response
 
 
 class Client:
+    MAX_CONTENT_LEN: Final[int] = 0xFFFF
+    # 12 byte nonce + 16 byte tag
+    AEAD_OVERHEAD: Final[int] = 28
+
     def __init__(this, ipAddress: tuple[str, int], aesKey: bytes, flags: PacketFlags, server: "APIServer") -> None:
         this.ip: IP = IP.fromTuple(ipAddress)
         this.aesKey = aesKey
         this.flags = flags
         this.server = server
+        this.requestId: int | None = None
 
-    async def _applyFlags(this, data: bytes):
-        # Pattern + headerLen + flags + contentLen
+    @staticmethod
+    def buildHeader(flags: int, contentLen: int, requestId: int | None = None) -> bytes:
+        # Pattern + headerLen + flags + contentLen (+ requestId in session mode)
         headerLen = 2 + 1 + 1 + 2
-        header = (b"tz" + headerLen.to_bytes(1, "big", signed=False) + this.flags.to_bytes(1, "big", signed=False))
+        if requestId is not None:
+            headerLen += 4
+            flags |= PacketFlags.SESSION
+
+        header = b"tz" + headerLen.to_bytes(1, "big", signed=False) + flags.to_bytes(1, "big", signed=False)
+        header += contentLen.to_bytes(2, "big", signed=False)
+        if requestId is not None:
+            header += requestId.to_bytes(4, "big", signed=False)
 
-        if this.flags & PacketFlags.MSGPACK:
-            data = Helpers.jsonToMsgpack(data)
-        if this.flags & PacketFlags.GUNZIP:
-            data = Helpers.compressGzip(data)
+        return header
 
-        if this.flags & PacketFlags.CHACHAPOLY or this.flags | PacketFlags.AESGCM:
-            header += int(len(data) + 28).to_bytes(2, "big", signed=False)
-            if this.flags & PacketFlags.CHACHAPOLY:
-                data = Helpers.ChaCha20Encrypt(data, this.aesKey, header)
-            elif this.flags & PacketFlags.AESGCM:
-                data = Helpers.AESEncrypt(data, this.aesKey, header)
+    def _buildHeader(this, contentLen: int) -> bytes:
+        return Client.buildHeader(this.flags, contentLen, this.requestId)
+
+    async def _applyFlags(this, data: bytes) -> bytes:
+        if this.flags & (PacketFlags.CHACHAPOLY | PacketFlags.AESGCM):
+            header = this._buildHeader(len(data) + this.AEAD_OVERHEAD)
+            encrypt = Helpers.ChaCha20Encrypt if this.flags & PacketFlags.CHACHAPOLY else Helpers.AESEncrypt
+            if len(data) > this.server.serverConfig.offloadThreshold:
+                data = await asyncio.to_thread(encrypt, data, this.aesKey, header)
+            else:
+                data = encrypt(data, this.aesKey, header)
 
         else:
-            header += len(data).to_bytes(2, "big", signed=False)
+            header = this._buildHeader(len(data))
 
         return header + data
 
-    async def send(this, data: bytes) -> None:
+    async def send(this, response: "Response") -> None:
+        body = response.encode(this.flags)
+        overhead = this.AEAD_OVERHEAD if this.flags & (PacketFlags.CHACHAPOLY | PacketFlags.AESGCM) else 0
+        if len(body) + overhead > this.MAX_CONTENT_LEN:
+            # contentLen is 16 bits, bulk lookups inside a batch can add up to more than that
+            Logger.error(f"A {len(body)} byte response doesn't fit into a packet, answering with {ErrorCode.RESPONSE_TOO_LARGE.code}")
+            body = ErrorCode.RESPONSE_TOO_LARGE.encode(this.flags)
+
+        await this.sendRaw(await this._applyFlags(body))
+
+    async def sendRaw(this, packet: bytes) -> None:
         pass
 
     async def close(this) -> None:
@@ -0,0 +1,58 @@
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Final
+
+import msgpack
+
+from server.protocol.APIPayload import PacketFlags
+
+
+class CodecError(ValueError):
+    pass
+
+
+class Codec(ABC):
+    name: str
+
+    @abstractmethod
+    def decode(this, data: bytes | memoryview) -> Any:  # noqa: ANN401
+        pass
+
+    @abstractmethod
+    def encode(this, obj: Any) -> bytes:  # noqa: ANN401
+        pass
+
+
+class JsonCodec(Codec):
+    name = "JSON"
+
+    def decode(this, data: bytes | memoryview) -> Any:  # noqa: ANN401
+        try:
+            # str() reads memoryviews directly, json.loads would need a bytes copy first
+            return json.loads(str(data, "utf-8"))
+        except (ValueError, TypeError) as e:
+            raise CodecError(str(e)) from e
+
+    def encode(this, obj: Any) -> bytes:  # noqa: ANN401
+        return json.dumps(obj).encode()
+
+
+class MsgPackCodec(Codec):
+    name = "MSGPack"
+
+    def decode(this, data: bytes | memoryview) -> Any:  # noqa: ANN401
+        try:
+            return msgpack.unpackb(data, raw=False)
+        except (ValueError, TypeError, msgpack.UnpackException) as e:
+            raise CodecError(str(e)) from e
+
+    def encode(this, obj: Any) -> bytes:  # noqa: ANN401
+        return msgpack.packb(obj)
+
+
+JSON_CODEC: Final[Codec] = JsonCodec()
+MSGPACK_CODEC: Final[Codec] = MsgPackCodec()
+
+
+def codecFor(flags: int) -> Codec:
+    return MSGPACK_CODEC if flags & PacketFlags.MSGPACK else JSON_CODEC
@@ -1,15 +1,43 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import Any, TypeVar, Generic, Literal
 
+from server.protocol.APIPayload import PacketFlags
+from server.protocol.Codec import codecFor
+from shared.Helpers import Helpers
+
 T = TypeVar("T")
 
-ValidStatusCode = Literal[200, 400, 403, 404, 405, 409, 500]
+# -1 is never sent, it marks requests that get no reply at all
+ValidStatusCode = Literal[-1, 200, 400, 403, 404, 405, 409, 413, 500]
 
-@dataclass
+@dataclass(frozen=True)
 class Response(Generic[T]):
     code: ValidStatusCode
     message: T
 
-    def __init__(this, code: ValidStatusCode, message: T) -> None:  # noqa: ANN401
-        this.code = code
-        this.message = message
+    def withMessage(this, message: Any) -> "Response":  # noqa: ANN401
+        return Response(this.code, message)
+
+    def toDict(this) -> dict[str, Any]:
+        return {"code": this.code, "message": this.message}
+
+    def encode(this, flags: int) -> bytes:
+        body = codecFor(flags).encode(this.toDict())
+        if flags & PacketFlags.GUNZIP:
+            body = Helpers.compressGzip(body)
+
+        return body
+
+
+@dataclass(frozen=True)
+class ResponseTemplate(Response[T]):
+    """Constant response, its encoded body is cached per JSON/MsgPack/gzip combination."""
+
+    _encoded: dict[int, bytes] = field(default_factory=dict, init=False, repr=False, compare=False)
+
+    def encode(this, flags: int) -> bytes:
+        flags &= PacketFlags.MSGPACK | PacketFlags.GUNZIP
+        if (body := this._encoded.get(flags)) is None:
+            body = this._encoded[flags] = super().encode(flags)
+
+        return body
@@ -1,19 +1,218 @@
 import asyncio
+from collections.abc import Coroutine
+from typing import TYPE_CHECKING, Final
 
-from server.protocol.APIPayload import PacketFlags
+from server.protocol.APIPayload import APIPayload, PacketFlags
 from server.protocol.Client import Client
+from server.RejectionTracker import RejectionReason, RejectionTracker, RequestRejectedError
+from shell.Logger import Logger
+
+if TYPE_CHECKING:
+    from server.APIServer import APIServer
 
 
 class TCPClient(Client):
-    def __init__(this, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, aesKey: bytes, server: "APIServer", flags: PacketFlags = 0) -> None:
-        this.reader: asyncio.StreamReader = reader
-        this.writer: asyncio.StreamWriter = writer
-        super().__init__(this.writer.get_extra_info("peername"), aesKey, flags, server)
-
-    async def send(this, data: bytes) -> None:
-        finalData = await this._applyFlags(data)
-        this.writer.write(finalData)
-
-        await this.writer.drain()
-        this.writer.close()
-        await this.writer.wait_closed()
+    def __init__(this, connection: "TCPProtocol", aesKey: bytes, server: "APIServer", flags: PacketFlags = 0, *, keepAlive: bool = False) -> None:
+        this.connection = connection
+        this.keepAlive = keepAlive
+        super().__init__(connection.transport.get_extra_info("peername"), aesKey, flags, server)
+
+    async def sendRaw(this, packet: bytes) -> None:
+        transport = this.connection.transport
+        if transport.is_closing():
+            return
+
+        transport.write(packet)
+        await this.connection.drain()
+
+        if not this.keepAlive:
+            transport.close()
+
+
+class TCPProtocol(asyncio.BufferedProtocol):
+    """
+    One instance per connection. Bytes are received into a reusable buffer and complete frames are decoded
+    straight from memoryview slices of it; only the dispatch of a decoded request runs in a task.
+    """
+
+    INITIAL_BUFFER_SIZE: Final[int] = 1 << 12
+    MIN_READ_SIZE: Final[int] = 1 << 10
+
+    def __init__(this, server: "APIServer") -> None:
+        this.server = server
+        this.transport: asyncio.Transport | None = None
+
+        this.buffer = bytearray(this.INITIAL_BUFFER_SIZE)
+        this.view = memoryview(this.buffer)
+        this.start = 0
+        this.end = 0
+
+        this.session: bool | None = None
+        this.closing = False
+        this.readingPaused = False
+        this.inFlight = 0
+        this.pending: set[asyncio.Task] = set()
+        this.idleHandle: asyncio.TimerHandle | None = None
+        this.writable = asyncio.Event()
+        this.writable.set()
+
+    def connection_made(this, transport: asyncio.Transport) -> None:
+        this.transport = transport
+        this.resetIdleTimer()
+
+    def connection_lost(this, _exc: Exception | None) -> None:
+        this.closing = True
+        this.writable.set()
+        if this.idleHandle:
+            this.idleHandle.cancel()
+
+    def get_buffer(this, _sizehint: int) -> memoryview:
+        if this.start == this.end:
+            this.start = this.end = 0
+        elif len(this.buffer) - this.end < this.MIN_READ_SIZE:
+            # Only the tail of an incomplete frame is ever moved, the buffer grows when that frame doesn't fit
+            size = this.end - this.start
+            partial = bytes(this.view[this.start:this.end])
+            if len(this.buffer) - size < this.MIN_READ_SIZE:
+                this.buffer = bytearray(len(this.buffer) * 2)
+                this.view = memoryview(this.buffer)
+
+            this.buffer[:size] = partial
+            this.start, this.end = 0, size
+
+        return this.view[this.end:]
+
+    def buffer_updated(this, nbytes: int) -> None:
+        this.end += nbytes
+        this.resetIdleTimer()
+        this.parseFrames()
+
+    def eof_received(this) -> bool:
+        this.finish()
+        return True
+
+    def pause_writing(this) -> None:
+        this.writable.clear()
+
+    def resume_writing(this) -> None:
+        this.writable.set()
+
+    async def drain(this) -> None:
+        await this.writable.wait()
+
+    def resetIdleTimer(this) -> None:
+        if this.idleHandle:
+            this.idleHandle.cancel()
+        this.idleHandle = asyncio.get_running_loop().call_later(this.server.serverConfig.sessionIdleTimeout, this.finish)
+
+    def parseFrames(this) -> None:
+        while not this.closing and this.inFlight < this.server.serverConfig.sessionMaxInFlight:
+            available = this.end - this.start
+            if available < APIPayload.HEADER_LEN_OFFSET + 1:
+                break
+
+            frameStart = this.start
+            if this.view[frameStart:frameStart + 2] != b"tz":
+                this.malformed(RejectionReason.BAD_MAGIC, frameStart)
+                return
+
+            headerLen = this.buffer[frameStart + APIPayload.HEADER_LEN_OFFSET]
+            if headerLen < APIPayload.HEADER_LEN:
+                this.malformed(RejectionReason.BAD_LENGTH, frameStart)
+                return
+
+            if available < APIPayload.HEADER_LEN:
+                break
+
+            contentLenStart = frameStart + APIPayload.CONTENT_LEN_OFFSET
+            frameLen = headerLen + int.from_bytes(this.view[contentLenStart:frameStart + APIPayload.HEADER_LEN], "big")
+            if available < frameLen:
+                break
+
+            this.start += frameLen
+            if this.session is None:
+                this.session = bool(this.buffer[frameStart + APIPayload.FLAGS_OFFSET] & PacketFlags.SESSION)
+
+            this.frameReceived(this.view[frameStart:frameStart + frameLen])
+
+            if not this.session:
+                this.finish()
+                return
+
+        if this.closing:
+            return
+
+        if this.inFlight >= this.server.serverConfig.sessionMaxInFlight:
+            this.pauseReading()
+        else:
+            this.resumeReading()
+
+    def frameReceived(this, frame: memoryview) -> None:
+        client = TCPClient(this, this.server.aesKey, this.server, keepAlive=this.session)
+        if this.server.shouldOffload(frame):
+            # Copied, the buffer is compacted before the thread gets to it
+            this.spawn(len(frame), this.server.processOffloaded(bytes(frame), client))
+            return
+
+        try:
+            coro = this.server.dispatchRequest(*this.server.decodeRequest(frame, client), client)
+        except RequestRejectedError as e:
+            coro = this.server.reject(e.reason, bytes(frame[:RejectionTracker.SAMPLE_BYTES]), client)
+
+        this.spawn(len(frame), coro)
+
+    def spawn(this, frameLen: int, coro: Coroutine) -> None:
+        this.inFlight += 1
+        task = asyncio.create_task(this.handle(frameLen, coro))
+        this.pending.add(task)
+        task.add_done_callback(this.pending.discard)
+
+    async def handle(this, frameLen: int, coro: Coroutine) -> None:
+        try:
+            await this.server.recordTraffic(frameLen, "TCP")
+            await coro
+        except Exception as e:  # noqa: BLE001
+            Logger.error(f"Error thrown while processing a TCP request: {e!s}")
+        finally:
+            this.inFlight -= 1
+            if this.closing:
+                this.closeWhenIdle()
+            else:
+                this.resetIdleTimer()
+                if this.readingPaused:
+                    this.parseFrames()
+
+    def malformed(this, reason: RejectionReason, frameStart: int) -> None:
+        sample = bytes(this.view[frameStart:min(this.end, frameStart + RejectionTracker.SAMPLE_BYTES)])
+        this.start = this.end
+
+        if this.session:
+            this.server.rejections.record(reason, "TCP", this.transport.get_extra_info("peername")[0], sample)
+            this.finish()
+            return
+
+        this.spawn(len(sample), this.server.reject(reason, sample, TCPClient(this, this.server.aesKey, this.server)))
+        this.finish()
+
+    def pauseReading(this) -> None:
+        if not this.readingPaused and not this.transport.is_closing():
+            this.readingPaused = True
+            this.transport.pause_reading()
+
+    def resumeReading(this) -> None:
+        if this.readingPaused and not this.transport.is_closing():
+            this.readingPaused = False
+            this.transport.resume_reading()
+
+    def finish(this) -> None:
+        """Stops reading, the connection is closed once every in-flight request has responded."""
+        if not this.closing:
+            this.closing = True
+            this.pauseReading()
+            if this.idleHandle:
+                this.idleHandle.cancel()
+        this.closeWhenIdle()
+
+    def closeWhenIdle(this) -> None:
+        if not this.inFlight and not this.transport.is_closing():
+            this.transport.close()
@@ -1,10 +1,12 @@
 import asyncio
 import contextlib
-from asyncio import Queue
+from asyncio import Queue, QueueFull
 from typing import Final
 
 from server.protocol.APIPayload import PacketFlags
 from server.protocol.Client import Client
+from server.RejectionTracker import RejectionReason
+from shell.Logger import Logger
 
 
 class UDPClient(Client):
@@ -12,9 +14,8 @@ class UDPClient(Client):
         super().__init__(ipAddress, aesKey, flags, server)
         this.transport: asyncio.DatagramTransport = transport
 
-    async def send(this, data: bytes) -> None:
-        finalData = await this._applyFlags(data)
-        this.transport.sendto(finalData, tuple(this.ip))
+    async def sendRaw(this, packet: bytes) -> None:
+        this.transport.sendto(packet, tuple(this.ip))
 
 
 class UDPProtocol(asyncio.DatagramProtocol):
@@ -23,23 +24,46 @@ class UDPProtocol(asyncio.DatagramProtocol):
     def __init__(this, server: "APIServer") -> None:  # noqa: ANN001
         this.server = server
         this.transport: asyncio.transports.DatagramTransport | None = None
-        this.requestQueue: Queue[tuple[bytes, UDPClient]] = Queue()
+        this.requestQueue: Queue[tuple[bytes, tuple[str, int]]] = Queue(maxsize=server.serverConfig.udpQueueSize)
+        this.workers: list[asyncio.Task] = []
+        this.droppedCount = 0
 
         this._STOP_EVENT = asyncio.Event()
 
     def connection_made(this, transport: asyncio.transports.DatagramTransport) -> None:
         this.transport = transport
+        this.workers = [asyncio.create_task(this.work()) for _ in range(this.server.serverConfig.udpWorkers)]
 
     def datagram_received(this, data: bytes, addr: tuple[str, int]) -> None:
-        client: UDPClient = UDPClient(this.transport, addr, this.server.aesKey, this.server)
         if not data.startswith(b"tz"):
-            asyncio.create_task(this.server.respondToInvalid(data, client))
+            this.server.rejections.record(RejectionReason.BAD_MAGIC, "UDP", addr[0], data)
             return
 
-        asyncio.create_task(this.server.processRequest(data, client))
+        try:
+            this.requestQueue.put_nowait((data, addr))
+        except QueueFull:
+            # Dropped without a busy reply, the source address is unverified and answering would reflect traffic at it
+            this.droppedCount += 1
+
+    async def work(this) -> None:
+        while True:
+            data, addr = await this.requestQueue.get()
+            try:
+                await this.server.processRequest(data, UDPClient(this.transport, addr, this.server.aesKey, this.server))
+            except Exception as e:  # noqa: BLE001
+                Logger.error(f"Error thrown while processing a UDP request: {e!s}")
+
+    def getMetrics(this) -> dict[str, object]:
+        return {
+            "api.udp.workers": len(this.workers),
+            "api.udp.queueDepth": this.requestQueue.qsize(),
+            "api.udp.queueSize": this.requestQueue.maxsize,
+            "api.udp.dropped": this.droppedCount,
+        }
 
     def close(this):
         this.transport.close()
-        this.requestQueue.empty()
+        for worker in this.workers:
+            worker.cancel()
         with contextlib.suppress(asyncio.CancelledError, TypeError):
             this._STOP_EVENT.set()
@@ -1,16 +1,15 @@
 import inspect
 import json
 import random
-
-import geoip2
-from geoip2 import errors  # noqa: F401
-from geoip2.models import City
+from functools import cached_property
 
 from server.Api import ApiKey, ApiPermissions
 from server.protocol.APIPayload import PacketFlags
 from server.protocol.Client import Client
 from server.protocol.Response import Response
 from server.protocol.TCP import TCPClient
+from server.ServerError import ErrorCode
+from shared.GeoIPTable import GeoLocation
 from shared.Helpers import Helpers
 from shell.Logger import Logger
 
@@ -45,8 +44,21 @@ class LinkPostData(UUIDData):
 class IPData(TypedDict):
     ip: str
 
+class UserIdsData(TypedDict):
+    userIds: list[int | str]
+
+class UUIDsData(TypedDict):
+    uuids: list[str]
+
+class BatchItemData(TypedDict):
+    requestType: int
+    data: NotRequired[dict]
+
+class BatchData(TypedDict):
+    requests: list[BatchItemData]
+
 # 3. Modern Union Type
-type RequestDataPayload = BaseData | UserIdData | UUIDData | LinkPostData | IPData
+type RequestDataPayload = BaseData | UserIdData | UUIDData | LinkPostData | IPData | BatchData | UserIdsData | UUIDsData
 
 
 def autoRespond(func: Callable[P, Coroutine[Any, Any, R]]) -> Callable[P, Coroutine[Any, Any, R]]:
@@ -64,7 +76,8 @@ class SimpleRequest[T: RequestDataPayload]:
     headers: RequestHeaders
     data: T
     response: Response | None = None
-    city: City | None
+    # Set on batch sub-requests, their responses are collected by the batch instead of being sent
+    deferResponse: bool = False
     protocol: str
     tzBot: "TZBot"
 
@@ -78,10 +91,11 @@ class SimpleRequest[T: RequestDataPayload]:
         this.tzBot = tzBot
 
         this.protocol = "TCP" if isinstance(client, TCPClient) else "UDP"
-        try:
-            this.city = this.tzBot.maxMindDb.city(this.client.ip.address)
-        except geoip2.errors.AddressNotFoundError:
-            this.city = None
+
+    @cached_property
+    def geoLocation(this) -> GeoLocation | None:
+        """Only looked up once something asks for it, most requests never get past the blacklist check with a private address."""
+        return this.tzBot.geoIp.locate(this.client.ip.address)
 
     def safe_get(this, key: str, default: any = None) -> any:
         """Helper to safely access data that Type Checker assumes exists but Runtime might not."""
@@ -89,12 +103,13 @@ class SimpleRequest[T: RequestDataPayload]:
 
     @autoRespond
     async def process(this) -> None:
-        if this.city and this.city.country.iso_code in Helpers.BLACKLISTED_COUNTRIES:
+        if this.geoLocation and this.geoLocation.countryCode in Helpers.BLACKLISTED_COUNTRIES:
             this.response = ErrorCode.BAD_GEOLOC
             return
 
     async def respond(this) -> None:
-        await sendResponse(this)
+        if not this.deferResponse:
+            await sendResponse(this)
 
     def __str__(this) -> str:
         return f"{this.__class__.__name__}({this.protocol}, {this.client.ip}, {this.headers}, {this.data})"
@@ -109,8 +124,7 @@ class PartiallyEncryptedRequest[T: RequestDataPayload](SimpleRequest[T]):
         if not this.response:
             if not this.client.flags & (PacketFlags.AESGCM | PacketFlags.CHACHAPOLY):
                 if not await Helpers.isLocalSubnet(this.client.ip.address):
-                    this.response = ErrorCode.BAD_REQUEST
-                    this.response.message = "Bad Request, Unencrypted"
+                    this.response = ErrorCode.UNENCRYPTED
 
 
 class EncryptedRequest[T: RequestDataPayload](SimpleRequest[T]):
@@ -121,31 +135,33 @@ class EncryptedRequest[T: RequestDataPayload](SimpleRequest[T]):
         super().process()
         if not this.response:
             if not this.client.flags & (PacketFlags.AESGCM | PacketFlags.CHACHAPOLY):
-                this.response = ErrorCode.BAD_REQUEST
-                this.response.message = "Bad Request, Unencrypted"
+                this.response = ErrorCode.UNENCRYPTED
 
 
 class APIRequest[T: RequestDataPayload](PartiallyEncryptedRequest[T]):
     def __init__(this, client: Client, headers: dict, data: dict, tzBot: "TZBot", *requiredPerms: ApiPermissions) -> None:
         super().__init__(client, headers, data, tzBot)
         this.requiredPerms = requiredPerms
+        this.requiredPermMask = ApiKey.permissionMask(*requiredPerms)
         this.rawApiKey = this.headers.get("apiKey")
+        # Batch sub-requests get the key their batch already resolved
+        this.apiKey: ApiKey | None = None
 
     async def process(this) -> None:
         await super().process()
         if not this.response:
-            if not this.rawApiKey:
-                this.response = ErrorCode.FORBIDDEN
-                return
-
-            if not await this.tzBot.apiDb.isValidKey(this.rawApiKey):
-                Logger.error("Key isn't in the DB")
-                this.response = ErrorCode.FORBIDDEN
-                return
-
-            apiKey = ApiKey.fromDbForm(this.rawApiKey)
-
-            if not apiKey.hasPermissions(*this.requiredPerms):
+            if not this.apiKey:
+                if not this.rawApiKey:
+                    this.response = ErrorCode.FORBIDDEN
+                    return
+
+                this.apiKey = this.tzBot.apiDb.getKey(this.rawApiKey)
+                if not this.apiKey:
+                    Logger.error("Key isn't in the DB")
+                    this.response = ErrorCode.FORBIDDEN
+                    return
+
+            if not this.apiKey.hasPermissionMask(this.requiredPermMask):
                 Logger.error("No permissions")
                 this.response = ErrorCode.FORBIDDEN
                 return
@@ -172,8 +188,7 @@ class UUIDRequest(APIRequest[UUIDData]):
 
     async def process(this) -> None:
         if (not this.response and this.uuid is None) or not Helpers.isUUID(this.uuid):
-            this.response = ErrorCode.BAD_REQUEST
-            this.response.message = "Invalid UUID"
+            this.response = ErrorCode.INVALID_UUID
 
 
 async def chinaResponse(request: SimpleRequest) -> None:
@@ -226,11 +241,11 @@ async def chinaResponse(request: SimpleRequest) -> None:
 
 async def sendResponse(request: SimpleRequest) -> None:
     if request.response and request.response.code == ErrorCode.BAD_GEOLOC.code:
-        Logger.log(f"Not responding due to it being from {request.city.country.iso_code}")
+        Logger.log(f"Not responding due to it being from {request.geoLocation.countryCode}")
         await request.tzBot.API_PACKET_LOGGER.sendLogEmbed(request)
         return
 
     if request.response:
-        Logger.log(f"Responding with: {json.dumps(request.response.__dict__)}")
-        await request.client.send(json.dumps(request.response.__dict__).encode())
+        Logger.log(f"Responding with: {json.dumps(request.response.toDict())}")
+        await request.client.send(request.response)
     await request.tzBot.API_PACKET_LOGGER.sendLogEmbed(request)
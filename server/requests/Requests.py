@@ -1,14 +1,13 @@
 import asyncio
 from typing import override
 
-import geoip2.errors
 import tzlocal
 
 from server.Api import ApiPermissions
 from server.ServerError import ErrorCode
 from server.protocol.Client import Client
 from server.requests.AbstractRequests import APIRequest, SimpleRequest, UserIdRequest, UUIDRequest, \
-    autoRespond, LinkPostData, IPData, UUIDData, BaseData
+    autoRespond, LinkPostData, IPData, UUIDData, BaseData, BatchData, UserIdsData, UUIDsData
 from shared.Helpers import Helpers
 from shared.Timezones import Timezones
 from shell.Logger import Logger
@@ -28,10 +27,8 @@ class TimeZoneRequest(UserIdRequest):
         await super().process()
 
         if not this.response:
-            this.response = ErrorCode.OK
-            this.response.message = await Helpers.tzBot.db.getTimeZone(this.userId)
-            if not this.response.message:
-                this.response = ErrorCode.NOT_FOUND
+            timezone = await Helpers.tzBot.db.getTimeZone(this.userId)
+            this.response = ErrorCode.OK.withMessage(timezone) if timezone else ErrorCode.NOT_FOUND
 
 
 class TimeZoneFromIPRequest(APIRequest[IPData]):
@@ -54,28 +51,21 @@ class TimeZoneFromIPRequest(APIRequest[IPData]):
             if not this.askedIp:
                 this.response = ErrorCode.BAD_REQUEST
             else:
-                try:
-                    if await Helpers.isLocalSubnet(this.askedIp):
-                        if await Helpers.isLocalSubnet(this.client.ip.address):
-                            this.response = ErrorCode.OK
-                            this.response.message = tzlocal.get_localzone().key
-                        else:
-                            requestCity = this.tzBot.maxMindDb.city(this.client.ip.address)
-                            if requestCity:
-                                this.response = ErrorCode.OK
-                                this.response.message = requestCity.location.time_zone
-                            else:
-                                this.response = ErrorCode.NOT_FOUND
+                if await Helpers.isLocalSubnet(this.askedIp):
+                    if await Helpers.isLocalSubnet(this.client.ip.address):
+                        this.response = ErrorCode.OK.withMessage(tzlocal.get_localzone().key)
                     else:
-                        requestCity = this.tzBot.maxMindDb.city(this.askedIp)
-                        if requestCity:
-                            this.response = ErrorCode.OK
-                            this.response.message = requestCity.location.time_zone
+                        location = this.geoLocation
+                        if location:
+                            this.response = ErrorCode.OK.withMessage(location.timeZone)
                         else:
                             this.response = ErrorCode.NOT_FOUND
-
-                except geoip2.errors.AddressNotFoundError:
-                    this.response = ErrorCode.NOT_FOUND
+                else:
+                    location = this.tzBot.geoIp.locate(this.askedIp)
+                    if location:
+                        this.response = ErrorCode.OK.withMessage(location.timeZone)
+                    else:
+                        this.response = ErrorCode.NOT_FOUND
 
 class PingRequest(SimpleRequest[BaseData]):
     def __init__(this, client: Client, headers: dict, data: dict, tzBot: "TZBot") -> None:
@@ -89,8 +79,7 @@ class PingRequest(SimpleRequest[BaseData]):
     @autoRespond
     async def process(this) -> None:
         if not this.response:
-            this.response = ErrorCode.OK
-            this.response.message = "Pong"
+            this.response = ErrorCode.PONG
 
 
 class UserIdUUIDLinkPost(APIRequest[LinkPostData]):
@@ -110,8 +99,7 @@ class UserIdUUIDLinkPost(APIRequest[LinkPostData]):
     async def process(this) -> None:
         # Check UUID validity manually since we don't inherit UUIDRequest anymore
         if (not this.response and this.uuid is None) or not Helpers.isUUID(this.uuid):
-            this.response = ErrorCode.BAD_REQUEST
-            this.response.message = "Invalid UUID" 
+            this.response = ErrorCode.INVALID_UUID
             return
 
         await super().process()
@@ -121,8 +109,7 @@ class UserIdUUIDLinkPost(APIRequest[LinkPostData]):
                 this.response = ErrorCode.NOT_FOUND
 
             elif await this.tzBot.db.getUserIdByUUID(this.uuid) or this.uuid in [val[0] for val in Helpers.tzBot.linkCodes.values()]:
-                this.response = ErrorCode.CONFLICT
-                this.response.message = "UUID already registered"
+                this.response = ErrorCode.UUID_CONFLICT
 
             else:
                 this.code = await Helpers.generateCharSequence(6)
@@ -130,8 +117,7 @@ class UserIdUUIDLinkPost(APIRequest[LinkPostData]):
                 this.tzBot.linkCodes.update({this.code: (this.uuid, this.timezone)})
                 asyncio.create_task(this.tzBot.removeCode(15, this.code))
 
-                this.response = ErrorCode.OK
-                this.response.message = this.code
+                this.response = ErrorCode.OK.withMessage(this.code)
 
 
 class TimezoneFromUUIDRequest(UUIDRequest):
@@ -153,8 +139,7 @@ class TimezoneFromUUIDRequest(UUIDRequest):
                 this.response = ErrorCode.NOT_FOUND
 
             else:
-                this.response = ErrorCode.OK
-                this.response.message = timezone
+                this.response = ErrorCode.OK.withMessage(timezone)
 
 
 class IsLinkedRequest(UUIDRequest):
@@ -171,9 +156,10 @@ class IsLinkedRequest(UUIDRequest):
         await super().process()
 
         if not this.response:
-            if discordUsername := await this.tzBot.db.getUserIdByUUID(this.uuid):
-                this.response = ErrorCode.OK
-                this.response.message = (await this.tzBot.fetch_user(discordUsername)).name
+            userId = await this.tzBot.db.getUserIdByUUID(this.uuid)
+            # A deleted Discord account is as good as not linked
+            if userId and (username := await this.tzBot.usernames.resolve(userId)):
+                this.response = ErrorCode.OK.withMessage(username)
             else:
                 this.response = ErrorCode.NOT_FOUND
 
@@ -195,8 +181,7 @@ class UserIDFromUUIDRequest(UUIDRequest):
             if not (userId := await this.tzBot.db.getUserIdByUUID(this.uuid)):
                 this.response = ErrorCode.NOT_FOUND
             else:
-                this.response = ErrorCode.OK
-                this.response.message = userId
+                this.response = ErrorCode.OK.withMessage(userId)
 
 
 class UUIDFromUserIDRequest(UserIdRequest):
@@ -216,5 +201,110 @@ class UUIDFromUserIDRequest(UserIdRequest):
             if not (uid := await this.tzBot.db.getUUIDByUserId(this.userId)):
                 this.response = ErrorCode.NOT_FOUND
             else:
-                this.response = ErrorCode.OK
-                this.response.message = uid
\ No newline at end of file
+                this.response = ErrorCode.OK.withMessage(uid)
+
+
+class BatchRequest(APIRequest[BatchData]):
+    def __init__(this, client: Client, headers: dict, data: dict, tzBot: "TZBot") -> None:
+        super().__init__(client, headers, data, tzBot)
+        this.items = this.data.get("requests")
+        this.subRequests: list[SimpleRequest | None] = []
+
+    @override
+    def packetNameStringRepr(this) -> str:
+        return "BATCH"
+
+    @override
+    @autoRespond
+    async def process(this) -> None:
+        await super().process()
+
+        if not this.response:
+            if not isinstance(this.items, list) or not 0 < len(this.items) <= this.tzBot.config.server.maxBatchSize:
+                this.response = ErrorCode.BAD_REQUEST
+                return
+
+            this.subRequests = [this.buildSubRequest(item) for item in this.items]
+            results = await asyncio.gather(*(request.process() for request in this.subRequests if request), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    Logger.error(f"Error thrown while processing a batched request: {result!s}")
+
+            responses = []
+            for request in this.subRequests:
+                if not request:
+                    responses.append(ErrorCode.BAD_REQUEST.toDict())
+                    continue
+
+                responses.append((request.response or ErrorCode.INTERNAL_SERVER_ERROR).toDict())
+                await this.tzBot.statsDb.addEstablishedKnownRequestType(request.packetNameStringRepr())
+
+            this.response = ErrorCode.OK.withMessage(responses)
+
+    def buildSubRequest(this, item: dict) -> SimpleRequest | None:
+        if not isinstance(item, dict) or not isinstance(item.get("data", {}), dict) or not isinstance(item.get("requestType"), int):
+            return None
+
+        reqType: type[SimpleRequest] = this.client.server.getRequestType(item["requestType"])
+        if reqType in (SimpleRequest, BatchRequest):
+            return None
+
+        request = reqType(this.client, this.headers, item.get("data", {}), this.tzBot)
+        request.deferResponse = True
+        if isinstance(request, APIRequest):
+            request.apiKey = this.apiKey
+
+        return request
+
+
+class TimezonesFromUserIdsRequest(APIRequest[UserIdsData]):
+    def __init__(this, client: Client, headers: dict, data: dict, tzBot: "TZBot") -> None:
+        super().__init__(client, headers, data, tzBot, ApiPermissions.DISCORD_ID)
+        userIds = this.data.get("userIds")
+        if isinstance(userIds, list) and all(str(userId).isdecimal() for userId in userIds):
+            this.userIds = [int(userId) for userId in userIds]
+        else:
+            this.userIds = None
+
+    @override
+    def packetNameStringRepr(this) -> str:
+        return "TIMEZONES_FROM_USERIDS"
+
+    @override
+    @autoRespond
+    async def process(this) -> None:
+        await super().process()
+
+        if not this.response:
+            if not this.userIds or len(this.userIds) > this.tzBot.config.server.maxBulkLookupSize:
+                this.response = ErrorCode.BAD_REQUEST
+                return
+
+            timezones = await this.tzBot.db.getTimezones(this.userIds)
+            this.response = ErrorCode.OK.withMessage({str(userId): timezone for userId, timezone in timezones.items()})
+
+
+class TimezonesFromUUIDsRequest(APIRequest[UUIDsData]):
+    def __init__(this, client: Client, headers: dict, data: dict, tzBot: "TZBot") -> None:
+        super().__init__(client, headers, data, tzBot, ApiPermissions.MINECRAFT_UUID)
+        this.uuids = this.data.get("uuids")
+
+    @override
+    def packetNameStringRepr(this) -> str:
+        return "TIMEZONES_FROM_UUIDS"
+
+    @override
+    @autoRespond
+    async def process(this) -> None:
+        await super().process()
+
+        if not this.response:
+            if not isinstance(this.uuids, list) or not 0 < len(this.uuids) <= this.tzBot.config.server.maxBulkLookupSize:
+                this.response = ErrorCode.BAD_REQUEST
+                return
+
+            if not all(Helpers.isUUID(uuid) for uuid in this.uuids):
+                this.response = ErrorCode.INVALID_UUID
+                return
+
+            this.response = ErrorCode.OK.withMessage(await this.tzBot.db.getTimezonesByUUIDs(this.uuids))
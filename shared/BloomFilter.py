@@ -0,0 +1,56 @@
+import math
+from hashlib import blake2b
+
+
+class BloomFilter:
+    """
+    Compact set membership with no false negatives. `key in filter` being False means the key was never added, True means
+    it probably was. Sized for `capacity` keys at `falsePositiveRate`, adding more keys only raises the false positive rate.
+    Keys can't be removed.
+    """
+
+    def __init__(this, capacity: int, falsePositiveRate: float) -> None:
+        this.capacity = capacity
+        this.falsePositiveRate = falsePositiveRate
+
+        this.bitCount = max(8, math.ceil(-capacity * math.log(falsePositiveRate) / math.log(2) ** 2))
+        this.hashCount = max(1, round(this.bitCount / capacity * math.log(2)))
+        this.bits = bytearray((this.bitCount + 7) // 8)
+
+        this.count = 0
+        this.lookups = 0
+        this.negatives = 0
+
+    def positions(this, key: object) -> list[int]:
+        # Double hashing, k positions out of two independent 64-bit hashes
+        digest = blake2b(str(key).encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8]), int.from_bytes(digest[8:]) | 1
+        return [(first + i * second) % this.bitCount for i in range(this.hashCount)]
+
+    def add(this, key: object) -> None:
+        for position in this.positions(key):
+            this.bits[position >> 3] |= 1 << (position & 7)
+        this.count += 1
+
+    def __contains__(this, key: object) -> bool:
+        this.lookups += 1
+        if all(this.bits[position >> 3] & (1 << (position & 7)) for position in this.positions(key)):
+            return True
+
+        this.negatives += 1
+        return False
+
+    def estimatedFalsePositiveRate(this) -> float:
+        return (1 - math.exp(-this.hashCount * this.count / this.bitCount)) ** this.hashCount
+
+    def getMetrics(this) -> dict[str, object]:
+        return {
+            "added": this.count,
+            "capacity": this.capacity,
+            "bytes": len(this.bits),
+            "hashes": this.hashCount,
+            "targetFalsePositiveRate": this.falsePositiveRate,
+            "estimatedFalsePositiveRate": round(this.estimatedFalsePositiveRate(), 6),
+            "lookups": this.lookups,
+            "negatives": this.negatives,
+        }
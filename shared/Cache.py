@@ -0,0 +1,72 @@
+import time
+from collections import OrderedDict
+from typing import Final
+
+MISSING: Final[object] = object()
+
+
+class LRUCache[K, V]:
+    """
+    Bounded LRU cache with an optional TTL. `get` returns `MISSING` on a miss, so `None` can be cached as a value.
+    `generation` changes on every invalidation and on every `set` without one. A read-through caller passes the generation
+    it saw before querying, so a result that raced with a write is dropped instead of overwriting the written value.
+    """
+
+    def __init__(this, maxSize: int, ttl: float | None = None) -> None:
+        this.maxSize = maxSize
+        this.ttl = ttl
+        this.entries: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+        this.generation = 0
+        this.hits = 0
+        this.misses = 0
+
+    def get(this, key: K) -> V | object:
+        entry = this.entries.get(key)
+        if entry is None:
+            this.misses += 1
+            return MISSING
+
+        expiresAt, value = entry
+        if this.ttl is not None and expiresAt < time.monotonic():
+            del this.entries[key]
+            this.misses += 1
+            return MISSING
+
+        this.entries.move_to_end(key)
+        this.hits += 1
+        return value
+
+    def set(this, key: K, value: V, generation: int | None = None) -> None:
+        if generation is None:
+            this.generation += 1
+        elif generation != this.generation:
+            return
+
+        expiresAt = time.monotonic() + this.ttl if this.ttl is not None else 0.0
+        this.entries[key] = (expiresAt, value)
+        this.entries.move_to_end(key)
+
+        if len(this.entries) > this.maxSize:
+            this.entries.popitem(last=False)
+
+    def invalidate(this, key: K) -> None:
+        this.generation += 1
+        this.entries.pop(key, None)
+
+    def clear(this) -> None:
+        this.generation += 1
+        this.entries.clear()
+
+    def __len__(this) -> int:
+        return len(this.entries)
+
+    def getMetrics(this) -> dict[str, object]:
+        lookups = this.hits + this.misses
+        return {
+            "size": len(this.entries),
+            "maxSize": this.maxSize,
+            "hits": this.hits,
+            "misses": this.misses,
+            "hitRatio": round(this.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,91 @@
+import ipaddress
+from collections import defaultdict
+
+import geoip2.database
+import geoip2.errors
+import maxminddb.errors
+
+from shared.Cache import MISSING, LRUCache
+from shared.GeoIPTable import GeoIPTable, GeoLocation
+
+
+class GeoIPResolver:
+    """
+    Country and timezone lookups against the MaxMind database. Loopback, private and other non-global addresses are never
+    in it, so they return None without walking the tree. So do unparseable addresses and lookups before a database is loaded.
+
+    Lookups use the flattened GeoIPTable once one matching the database is built. Until then they go to the reader, and those
+    results, including misses, are cached against the network MaxMind returned with them, so any address in an already seen
+    network is a hit. A cache key is (IP version, prefix length, network bits), lookups try each prefix length seen so far.
+    """
+
+    def __init__(this, cacheSize: int, reader: geoip2.database.Reader | None = None) -> None:
+        this.reader = reader
+        this.table: GeoIPTable | None = None
+        this.networks: LRUCache[tuple[int, int, int], GeoLocation | None] = LRUCache(cacheSize)
+        this.prefixLengths: defaultdict[int, set[int]] = defaultdict(set)
+
+        this.lookups = 0
+        this.tableLookups = 0
+        this.shortCircuits = 0
+        this.cacheHits = 0
+
+    def swap(this, reader: geoip2.database.Reader) -> None:
+        previous, this.reader = this.reader, reader
+        this.networks.clear()
+        this.prefixLengths.clear()
+        if this.table and this.table.buildEpoch != reader.metadata().build_epoch:
+            this.table = None
+        if previous:
+            previous.close()
+
+    def swapTable(this, table: GeoIPTable) -> None:
+        this.table = table
+
+    def locate(this, address: str) -> GeoLocation | None:
+        try:
+            ip = ipaddress.ip_address(address)
+        except ValueError:
+            return None
+
+        if not ip.is_global or not this.reader:
+            this.shortCircuits += 1
+            return None
+
+        if this.table:
+            this.tableLookups += 1
+            return this.table.lookup(ip)
+
+        bits = int(ip)
+        for prefixLength in this.prefixLengths[ip.version]:
+            location = this.networks.get((ip.version, prefixLength, bits >> (ip.max_prefixlen - prefixLength)))
+            if location is not MISSING:
+                this.cacheHits += 1
+                return location
+
+        this.lookups += 1
+        try:
+            city = this.reader.city(ip)
+            location = GeoLocation(city.country.iso_code, city.location.time_zone) if city.country.iso_code or city.location.time_zone else None
+            network = city.traits.network
+        except geoip2.errors.AddressNotFoundError as e:
+            location, network = None, e.network
+        except maxminddb.errors.InvalidDatabaseError:
+            return None
+
+        if network:
+            this.prefixLengths[ip.version].add(network.prefixlen)
+            this.networks.set((ip.version, network.prefixlen, int(network.network_address) >> (ip.max_prefixlen - network.prefixlen)), location)
+        return location
+
+    def getMetrics(this) -> dict[str, object]:
+        resolved = this.lookups + this.cacheHits
+        return {
+            "lookups": this.lookups,
+            "tableLookups": this.tableLookups,
+            "tableBuildEpoch": this.table.buildEpoch if this.table else None,
+            "shortCircuits": this.shortCircuits,
+            "cache.size": len(this.networks),
+            "cache.hits": this.cacheHits,
+            "cache.hitRatio": round(this.cacheHits / resolved, 4) if resolved else 0.0,
+        }
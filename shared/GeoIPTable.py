@@ -0,0 +1,124 @@
+import ipaddress
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Final
+
+import maxminddb
+import numpy as np
+
+
+@dataclass(frozen=True)
+class GeoLocation:
+    countryCode: str | None
+    timeZone: str | None
+
+
+class GeoIPTable:
+    """
+    The GeoLite2 City database flattened to what we use of it. Every address range maps to a small location ID,
+    looked up with a binary search over sorted range starts. IPv4 starts are full addresses, IPv6 starts are the
+    high 64 bits. GeoLite2 rarely has IPv6 networks longer than /64, of those only the first one in each /64 is kept.
+    A start with location 0 begins a gap that isn't in the database.
+
+    Saved as .npy arrays plus a JSON file of locations, loaded memory-mapped.
+    """
+
+    ARRAYS: Final[tuple[str, ...]] = ("v4Starts", "v4Locations", "v6Starts", "v6Locations")
+    LOCATIONS_FILE: Final[str] = "locations.json"
+    IPV4: Final[int] = 4
+    IPV6: Final[int] = 6
+    V6_SHIFT: Final[int] = 64
+
+    def __init__(this, arrays: dict[str, np.ndarray], locations: list[GeoLocation | None], buildEpoch: int) -> None:
+        this.v4Starts = arrays["v4Starts"]
+        this.v4Locations = arrays["v4Locations"]
+        this.v6Starts = arrays["v6Starts"]
+        this.v6Locations = arrays["v6Locations"]
+        this.locations = locations
+        this.buildEpoch = buildEpoch
+
+    @staticmethod
+    def build(mmdbFile: Path) -> "GeoIPTable":
+        unknown = GeoLocation(None, None)
+        ids: dict[GeoLocation, int] = {unknown: 0}
+        # version -> (starts, location IDs, end of the last range)
+        ranges: dict[int, tuple[list[int], list[int], list[int]]] = {GeoIPTable.IPV4: ([], [], [0]), GeoIPTable.IPV6: ([], [], [0])}
+
+        with maxminddb.open_database(mmdbFile) as reader:
+            buildEpoch = reader.metadata().build_epoch
+            for network, record in reader:
+                location = GeoLocation(record.get("country", {}).get("iso_code"), record.get("location", {}).get("time_zone"))
+                locationId = ids.setdefault(location, len(ids))
+
+                shift = 0 if network.version == GeoIPTable.IPV4 else GeoIPTable.V6_SHIFT
+                start, end = int(network.network_address) >> shift, (int(network.broadcast_address) >> shift) + 1
+                starts, locationIds, last = ranges[network.version]
+                if start < last[0]:
+                    # A second network inside the same /64
+                    continue
+                if start > last[0]:
+                    GeoIPTable.append(starts, locationIds, last[0], 0)
+                GeoIPTable.append(starts, locationIds, start, locationId)
+                last[0] = end
+
+        if len(ids) > np.iinfo(np.uint16).max:
+            raise ValueError(f"{len(ids)} locations don't fit into uint16 IDs")
+
+        arrays = {}
+        for version, dtype, size in ((GeoIPTable.IPV4, np.uint32, 1 << 32), (GeoIPTable.IPV6, np.uint64, 1 << 64)):
+            starts, locationIds, last = ranges[version]
+            if last[0] < size:
+                GeoIPTable.append(starts, locationIds, last[0], 0)
+            arrays[f"v{version}Starts"] = np.array(starts, dtype=dtype)
+            arrays[f"v{version}Locations"] = np.array(locationIds, dtype=np.uint16)
+
+        locations: list[GeoLocation | None] = [None, *list(ids)[1:]]
+        return GeoIPTable(arrays, locations, buildEpoch)
+
+    @staticmethod
+    def append(starts: list[int], locationIds: list[int], start: int, locationId: int) -> None:
+        # Neighbouring ranges with the same location are merged
+        if not locationIds or locationIds[-1] != locationId:
+            starts.append(start)
+            locationIds.append(locationId)
+
+    def save(this, directory: Path) -> None:
+        """Every file is replaced atomically and the locations file, which holds the build epoch, goes last."""
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / this.LOCATIONS_FILE).unlink(missing_ok=True)
+        for name in this.ARRAYS:
+            temporary = directory / f"{name}.tmp.npy"
+            np.save(temporary, getattr(this, name))
+            temporary.replace(directory / f"{name}.npy")
+
+        temporary = directory / f"{this.LOCATIONS_FILE}.tmp"
+        locations = [[location.countryCode, location.timeZone] if location else None for location in this.locations]
+        temporary.write_text(json.dumps({"buildEpoch": this.buildEpoch, "locations": locations}))
+        temporary.replace(directory / this.LOCATIONS_FILE)
+
+    @staticmethod
+    def load(directory: Path) -> "GeoIPTable | None":
+        try:
+            metadata = json.loads((directory / GeoIPTable.LOCATIONS_FILE).read_text())
+            arrays = {name: np.load(directory / f"{name}.npy", mmap_mode="r") for name in GeoIPTable.ARRAYS}
+            locations = [GeoLocation(*location) if location else None for location in metadata["locations"]]
+            buildEpoch = metadata["buildEpoch"]
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing, truncated or hand-edited files just mean the table gets rebuilt
+            return None
+
+        return GeoIPTable(arrays, locations, buildEpoch)
+
+    def lookup(this, ip: ipaddress.IPv4Address | ipaddress.IPv6Address) -> GeoLocation | None:
+        if ip.version == this.IPV6 and ip.ipv4_mapped:
+            ip = ip.ipv4_mapped
+
+        if ip.version == this.IPV4:
+            starts, locationIds, key = this.v4Starts, this.v4Locations, int(ip)
+        else:
+            starts, locationIds, key = this.v6Starts, this.v6Locations, int(ip) >> this.V6_SHIFT
+
+        # A plain int key would be compared as a float64 against the uint64 starts
+        index = int(starts.searchsorted(starts.dtype.type(key), side="right")) - 1
+        return this.locations[locationIds[index]] if index >= 0 else None
@@ -1,18 +1,18 @@
 import asyncio
+import functools
 import gzip
 import inspect
 import ipaddress
-import json
 import os
 import random
 import re
 import string
 import tempfile
+import zlib
 from io import BytesIO
 from pathlib import Path
 from typing import ParamSpec, TypeVar, Callable, Coroutine, Any, NewType
 
-import msgpack
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
@@ -109,8 +109,8 @@ class Helpers:
     async def getCountryOrHost(request: "SimpleRequest") -> str:
         hosts: dict[str, str] = await Helpers.getHosts()
 
-        if request.city:
-            return request.city.country.iso_code
+        if request.geoLocation:
+            return request.geoLocation.countryCode
 
         if request.client.ip.address == "127.0.0.1":
             with Helpers.HOSTNAME_FILE.open("r") as f:
@@ -214,56 +214,54 @@ class Helpers:
         encryptedMessage = cipher.encrypt(paddedMessage)
         return iv + encryptedMessage
 
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def aesGcm(key: bytes) -> AESGCM:
+        # Built once per key, encrypt and decrypt are safe to call from several threads
+        return AESGCM(key)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=8)
+    def chaCha20Poly1305(key: bytes) -> ChaCha20Poly1305:
+        return ChaCha20Poly1305(key)
+
     @staticmethod
     def AESDecrypt(msg: bytes, key: bytes, additional: bytes | None = None) -> bytes:
         iv = msg[:12]
         ciphertext = msg[12:]
 
-        cipher = AESGCM(key)
-        return cipher.decrypt(iv, ciphertext, additional)
+        return Helpers.aesGcm(key).decrypt(iv, ciphertext, additional)
 
     @staticmethod
     def AESEncrypt(msg: bytes, key: bytes, additional: bytes | None = None) -> bytes:
         iv = os.urandom(12)
-        cipher = AESGCM(key)
 
-        return iv + cipher.encrypt(iv, msg, additional)
+        return iv + Helpers.aesGcm(key).encrypt(iv, msg, additional)
 
     @staticmethod
     def ChaCha20Decrypt(msg: bytes, key: bytes, additional: bytes | None = None) -> bytes:
         iv = msg[:12]
         ciphertext = msg[12:]
 
-        cipher = ChaCha20Poly1305(key)
-        return cipher.decrypt(iv, ciphertext, additional)
+        return Helpers.chaCha20Poly1305(key).decrypt(iv, ciphertext, additional)
 
     @staticmethod
     def ChaCha20Encrypt(msg: bytes, key: bytes, additional: bytes | None = None) -> bytes:
         iv = os.urandom(12)
-        cipher = ChaCha20Poly1305(key)
 
-        return iv + cipher.encrypt(iv, msg, additional)
+        return iv + Helpers.chaCha20Poly1305(key).encrypt(iv, msg, additional)
 
     @staticmethod
-    def unGzip(msg: bytes) -> bytes | None:
+    def unGzip(msg: bytes, maxSize: int) -> bytes | None:
+        """None if msg isn't a complete gzip stream or inflates to more than maxSize bytes, which are never all inflated."""
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
         try:
-            return gzip.decompress(msg)
-        except Exception:
+            content = decompressor.decompress(msg, maxSize + 1)
+        except zlib.error:
             return None
 
+        return content if decompressor.eof and len(content) <= maxSize else None
+
     @staticmethod
     def compressGzip(msg: bytes) -> bytes:
         return gzip.compress(msg)
-
-    @staticmethod
-    def msgpackToJson(msg: bytes) -> bytes | None:
-        try:
-            obj = msgpack.unpackb(msg, raw=False)
-            return json.dumps(obj).encode()
-        except Exception:
-            return None
-
-    @staticmethod
-    def jsonToMsgpack(msg: bytes) -> bytes:
-        obj = json.loads(msg.decode())
-        return msgpack.packb(obj)
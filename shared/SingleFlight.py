@@ -0,0 +1,33 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+
+
+class SingleFlight[K: Hashable, V]:
+    """
+    Coalesces concurrent calls for the same key: the first caller starts the call and everyone asking for that key
+    before it finishes awaits the same future. Results aren't kept, the next call after completion runs again.
+    """
+
+    def __init__(this) -> None:
+        this.inFlight: dict[K, asyncio.Future[V]] = {}
+        this.calls = 0
+        this.deduplicated = 0
+
+    async def run[*Ts](this, key: K, func: Callable[[*Ts], Awaitable[V]], *args: *Ts) -> V:
+        if (future := this.inFlight.get(key)) is not None:
+            this.deduplicated += 1
+        else:
+            this.calls += 1
+            future = asyncio.ensure_future(func(*args))
+            this.inFlight[key] = future
+            future.add_done_callback(lambda done: this.forget(key, done))
+
+        # A cancelled caller must not cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def forget(this, key: K, future: asyncio.Future[V]) -> None:
+        if this.inFlight.get(key) is future:
+            del this.inFlight[key]
+
+    def getMetrics(this) -> dict[str, object]:
+        return {"calls": this.calls, "deduplicated": this.deduplicated, "inFlight": len(this.inFlight)}
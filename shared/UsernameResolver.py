@@ -0,0 +1,43 @@
+import discord
+
+from shared.Cache import MISSING, LRUCache
+from shared.SingleFlight import SingleFlight
+
+
+class UsernameResolver:
+    """
+    User ID -> username with a TTL. Misses are answered from the gateway's user cache when the user is in it, and only
+    otherwise fetched over REST, with concurrent fetches of the same user coalesced. Invalidated by user and member updates.
+    """
+
+    def __init__(this, client: discord.Client, maxSize: int, ttl: float) -> None:
+        this.client = client
+        this.usernames: LRUCache[int, str] = LRUCache(maxSize, ttl)
+        this.fetches: SingleFlight[tuple[int, int], discord.User] = SingleFlight()
+        this.gatewayHits = 0
+
+    async def resolve(this, userId: int) -> str | None:
+        """None if Discord doesn't know the user (anymore), that isn't cached."""
+        if (username := this.usernames.get(userId)) is not MISSING:
+            return username
+
+        generation = this.usernames.generation
+        if user := this.client.get_user(userId):
+            this.gatewayHits += 1
+        else:
+            try:
+                user = await this.fetches.run((userId, generation), this.client.fetch_user, userId)
+            except discord.NotFound:
+                return None
+
+        this.usernames.set(userId, user.name, generation)
+        return user.name
+
+    def invalidate(this, userId: int) -> None:
+        this.usernames.invalidate(userId)
+
+    def getMetrics(this) -> dict[str, object]:
+        metrics = {f"cache.{key}": value for key, value in this.usernames.getMetrics().items()}
+        metrics.update({f"fetch.{key}": value for key, value in this.fetches.getMetrics().items()})
+        metrics["gatewayHits"] = this.gatewayHits
+        return metrics
@@ -1,5 +1,6 @@
 import asyncio
 import os
+import sqlite3
 import stat
 import sys
 from abc import ABC, abstractmethod
@@ -8,6 +9,7 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+import aiomysql
 import tzlocal
 from discord import ExtensionAlreadyLoaded, ExtensionFailed, ExtensionNotFound, ExtensionNotLoaded, NoEntryPointError
 
@@ -340,6 +342,54 @@ class ForceSaveStats(Command):
     def validateArgs(this, args: list[str]) -> bool:
         return len(args) == 0
 
+class RevokeKey(Command):
+    def __init__(this) -> None:
+        super().__init__("revokekey", "Revokes an API key immediately")
+
+    async def execute(this, args: list[str], ctx: CommandContext) -> CommandResult:  # noqa: ARG002
+        client: TZBot = Helpers.tzBot
+
+        if not await client.apiDb.revokeKey(args[0]):
+            return CommandResult(False, "No such API key.")
+
+        Logger.success("API key revoked!")
+        return CommandResult(True)
+
+    def validateArgs(this, args: list[str]) -> bool:
+        return len(args) == 1
+
+class Reconcile(Command):
+    def __init__(this) -> None:
+        super().__init__("reconcile", "Compares SQLite with MariaDB and repairs any drift")
+
+    async def execute(this, args: list[str], ctx: CommandContext) -> CommandResult:  # noqa: ARG002
+        client: TZBot = Helpers.tzBot
+
+        try:
+            await client.db.reconcile()
+        except (aiomysql.Error, sqlite3.Error) as e:
+            return CommandResult(False, f"Reconciliation failed: {e!s}")
+
+        return CommandResult(True)
+
+    def validateArgs(this, args: list[str]) -> bool:
+        return len(args) == 0
+
+class Metrics(Command):
+    def __init__(this) -> None:
+        super().__init__("metrics", "Shows cache and server metrics")
+
+    async def execute(this, args: list[str], ctx: CommandContext) -> CommandResult:  # noqa: ARG002
+        client: TZBot = Helpers.tzBot
+
+        for key, value in sorted(client.getMetrics().items()):
+            ctx.log(f"{key}: {value}")
+
+        return CommandResult(True)
+
+    def validateArgs(this, args: list[str]) -> bool:
+        return len(args) == 0
+
 class Graph(Command):
     def __init__(this) -> None:
         super().__init__("graph", "Creates a graph from telemetry")
@@ -11,7 +11,7 @@ from prompt_toolkit.widgets import TextArea
 
 from shared.Helpers import Helpers
 from shell.Commands import ForceSync, Load, ModList, Reload, Unload, createCommandSystem, ForceSaveStats, Graph, \
-    CommandRegistry, CommandContext
+    CommandRegistry, CommandContext, Metrics, Reconcile, RevokeKey
 from shell.Logger import Logger
 
 
@@ -41,6 +41,9 @@ class Shell(Application):
         this.commandRegistry.register(ForceSync())
         this.commandRegistry.register(ForceSaveStats())
         this.commandRegistry.register(Graph())
+        this.commandRegistry.register(Metrics())
+        this.commandRegistry.register(RevokeKey())
+        this.commandRegistry.register(Reconcile())
 
         this.logLines: list[str] = []
         this.autoScroll = True
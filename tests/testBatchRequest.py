@@ -0,0 +1,78 @@
+"""Run from the repository root: python -m unittest discover -s tests"""
+import json
+import unittest
+from types import SimpleNamespace
+
+from config.Config import ServerConfig
+from server.Api import ApiKey, ApiPermissions
+from server.APIServer import APIServer
+from server.protocol.APIPayload import PacketFlags
+from server.protocol.Client import Client
+from server.requests.Requests import BatchRequest
+from shared.GeoIP import GeoIPResolver
+from shared.Helpers import Helpers
+
+KEY = b"0" * 32
+TIMEZONE = "America/Argentina/ComodRivadavia"
+
+
+class RecordingClient(Client):
+    def __init__(this, server: SimpleNamespace, flags: int) -> None:
+        super().__init__(("127.0.0.1", 5000), KEY, flags, server)
+        this.packets: list[bytes] = []
+
+    async def sendRaw(this, packet: bytes) -> None:
+        this.packets.append(packet)
+
+
+class BatchRequestTest(unittest.IsolatedAsyncioTestCase):
+    async def batch(this, items: list[dict], flags: int) -> dict:
+        async def getTimezones(userIds: list[int]) -> dict[int, str]:
+            return dict.fromkeys(userIds, TIMEZONE)
+
+        async def ignore(*_args: object) -> None:
+            pass
+
+        serverConfig = ServerConfig(0, "0" * 32, "1" * 32, 1, 1)
+        server = SimpleNamespace(serverConfig=serverConfig, getRequestType=APIServer.REQUEST_TYPES.__getitem__)
+        apiKey = ApiKey(1, ApiKey.permissionMask(ApiPermissions.DISCORD_ID))
+        tzBot = SimpleNamespace(
+            config=SimpleNamespace(server=serverConfig),
+            db=SimpleNamespace(getTimezones=getTimezones),
+            apiDb=SimpleNamespace(getKey=lambda _key: apiKey),
+            statsDb=SimpleNamespace(addEstablishedKnownRequestType=ignore),
+            geoIp=GeoIPResolver(16),
+            API_PACKET_LOGGER=SimpleNamespace(sendLogEmbed=ignore),
+        )
+        client = RecordingClient(server, flags)
+        await BatchRequest(client, {"apiKey": "key"}, {"requests": items}, tzBot).process()
+
+        this.assertEqual(len(client.packets), 1)
+        packet = client.packets[0]
+        headerLen, contentLen = packet[2], int.from_bytes(packet[4:6], "big")
+        this.assertEqual(len(packet), headerLen + contentLen)
+
+        content = packet[headerLen:]
+        if flags & PacketFlags.AESGCM:
+            content = Helpers.AESDecrypt(content, KEY, packet[:headerLen])
+        return json.loads(content)
+
+    @staticmethod
+    def bulkLookup(first: int) -> dict:
+        return {"requestType": 9, "data": {"userIds": list(range(first, first + 500))}}
+
+    async def testBatchWithinOnePacket(this) -> None:
+        reply = await this.batch([this.bulkLookup(10**17)], PacketFlags.AESGCM)
+        this.assertEqual(reply["code"], 200)
+        this.assertEqual(len(reply["message"][0]["message"]), 500)
+
+    async def testOversizedBatchGetsAnError(this) -> None:
+        # 5 x 500 IDs is valid input, but the answers add up to well over 65535 bytes
+        items = [this.bulkLookup(10**17 + 1000 * i) for i in range(5)]
+        for flags in (PacketFlags.AESGCM, 0):
+            reply = await this.batch(items, flags)
+            this.assertEqual(reply, {"code": 413, "message": "Response Too Large"})
+
+
+if __name__ == "__main__":
+    unittest.main()
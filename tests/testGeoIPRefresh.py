@@ -0,0 +1,137 @@
+"""Run from the repository root: python -m unittest discover -s tests"""
+import asyncio
+import io
+import ipaddress
+import tarfile
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from aiohttp import web
+
+from config.Config import MaxmindConfig
+from modules.TZBot import TZBot
+from shared.GeoIP import GeoIPResolver
+from shared.GeoIPTable import GeoIPTable, GeoLocation
+
+FIXTURE_DB_FILE = Path(__file__).parent / "fixtures" / "GeoLite2-City.mmdb"
+
+
+def buildArchive() -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+        tar.add(FIXTURE_DB_FILE, arcname="GeoLite2-City_20260101/GeoLite2-City.mmdb")
+    return buffer.getvalue()
+
+
+class GeoIPRefreshTest(unittest.IsolatedAsyncioTestCase):
+    """syncGeoIP and the periodic refresh against a local stand-in for the MaxMind download endpoint."""
+
+    ARCHIVE = buildArchive()
+
+    async def asyncSetUp(this) -> None:
+        this.downloads = 0
+        this.broken = False
+
+        app = web.Application()
+        app.router.add_get("/db", this.serveArchive)
+        this.runner = web.AppRunner(app)
+        await this.runner.setup()
+        site = web.TCPSite(this.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+
+        this.stateDir = tempfile.TemporaryDirectory()
+        this.addCleanup(this.stateDir.cleanup)
+        state = Path(this.stateDir.name)
+
+        this.bot = object.__new__(TZBot)
+        this.bot.config = SimpleNamespace(maxmind=MaxmindConfig(1, "token", f"http://127.0.0.1:{port}/db", 0.2))
+        this.bot.syncOverride = False
+        this.bot.geoIp = GeoIPResolver(16)
+        this.bot.GEO_IP_DB_FILE = state / "GeoLite2-City.mmdb"
+        this.bot.GEO_IP_TABLE_DIR = state / "GeoIPTable"
+        this.bot.GEO_IP_RETRY_INTERVAL = 0.05
+
+    async def asyncTearDown(this) -> None:
+        if this.bot.geoIp.reader:
+            this.bot.geoIp.reader.close()
+        await this.runner.cleanup()
+
+    async def serveArchive(this, request: web.Request) -> web.StreamResponse:
+        this.downloads += 1
+        if this.broken:
+            return web.Response(body=b"not a tar", content_type="application/tar+gzip")
+
+        response = web.StreamResponse(headers={"Content-Type": "application/tar+gzip"})
+        await response.prepare(request)
+        for offset in range(0, len(this.ARCHIVE), 512):
+            await response.write(this.ARCHIVE[offset:offset + 512])
+        return response
+
+    def stateFiles(this) -> list[str]:
+        return sorted(file.name for file in this.bot.GEO_IP_DB_FILE.parent.iterdir() if file.is_file())
+
+    async def testSyncSwapsReader(this) -> None:
+        this.assertTrue(await this.bot.syncGeoIP())
+        this.assertEqual(this.stateFiles(), ["GeoLite2-City.mmdb"])
+        this.assertEqual(this.bot.geoIp.locate("8.8.8.8"), GeoLocation("US", "America/Chicago"))
+
+        # Fresh enough, not downloaded again
+        this.assertFalse(await this.bot.syncGeoIP())
+        this.assertEqual(this.downloads, 1)
+
+    async def testCorruptArchiveKeepsLiveReader(this) -> None:
+        await this.bot.syncGeoIP()
+        reader = this.bot.geoIp.reader
+
+        this.broken = True
+        this.bot.syncOverride = True
+        this.assertFalse(await this.bot.syncGeoIP())
+        this.assertIs(this.bot.geoIp.reader, reader)
+        this.assertEqual(this.stateFiles(), ["GeoLite2-City.mmdb"])
+
+    async def testPeriodicRefreshBuildsTable(this) -> None:
+        task = asyncio.create_task(this.bot.refreshGeoIPPeriodically())
+        await asyncio.sleep(0.5)
+        task.cancel()
+
+        this.assertGreaterEqual(this.downloads, 2)
+        this.assertIsNotNone(this.bot.geoIp.table)
+        this.assertEqual(this.bot.geoIp.table.lookup(ipaddress.ip_address("1.2.3.4")), GeoLocation("CZ", "Europe/Prague"))
+
+    async def testPeriodicRefreshSurvivesUnexpectedErrors(this) -> None:
+        failures = 0
+        sync = this.bot.syncGeoIP
+
+        async def failingSync() -> bool:
+            nonlocal failures
+            if failures < 2:
+                failures += 1
+                raise RuntimeError("unexpected")
+            return await sync()
+
+        this.bot.syncGeoIP = failingSync
+        task = asyncio.create_task(this.bot.refreshGeoIPPeriodically())
+        await asyncio.sleep(0.3)
+        this.assertFalse(task.done())
+        task.cancel()
+
+        this.assertEqual(failures, 2)
+        this.assertIsNotNone(this.bot.geoIp.reader)
+
+    async def testDamagedTableIsRebuilt(this) -> None:
+        await this.bot.syncGeoIP()
+        await this.bot.refreshGeoIPTable()
+
+        locationsFile = this.bot.GEO_IP_TABLE_DIR / GeoIPTable.LOCATIONS_FILE
+        locationsFile.write_text('{"locations": 1}')
+        this.assertIsNone(GeoIPTable.load(this.bot.GEO_IP_TABLE_DIR))
+
+        await this.bot.refreshGeoIPTable()
+        this.assertIsNotNone(GeoIPTable.load(this.bot.GEO_IP_TABLE_DIR))
+
+
+if __name__ == "__main__":
+    unittest.main()
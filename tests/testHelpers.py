@@ -0,0 +1,40 @@
+"""Run from the repository root: python -m unittest discover -s tests"""
+import gzip
+import os
+import unittest
+
+from shared.Helpers import Helpers
+
+KEY = os.urandom(32)
+
+
+class UnGzipTest(unittest.TestCase):
+    def testRoundTrip(this) -> None:
+        body = b'{"data": {"userId": 1}}' * 100
+        this.assertEqual(Helpers.unGzip(gzip.compress(body), len(body)), body)
+        this.assertEqual(Helpers.unGzip(memoryview(gzip.compress(body)), len(body)), body)
+
+    def testInflatedSizeIsCapped(this) -> None:
+        bomb = gzip.compress(bytes(16 << 20))
+        this.assertLess(len(bomb), 32 << 10)
+        this.assertIsNone(Helpers.unGzip(bomb, 1 << 20))
+
+    def testRejectsBrokenStreams(this) -> None:
+        compressed = gzip.compress(b"hello world")
+        this.assertIsNone(Helpers.unGzip(b"not gzip", 1024))
+        this.assertIsNone(Helpers.unGzip(compressed[:-4], 1024))
+
+
+class AEADTest(unittest.TestCase):
+    def testCipherContextsAreReused(this) -> None:
+        this.assertIs(Helpers.aesGcm(KEY), Helpers.aesGcm(KEY))
+        this.assertIs(Helpers.chaCha20Poly1305(KEY), Helpers.chaCha20Poly1305(KEY))
+
+    def testRoundTrip(this) -> None:
+        header = b"tz\x06\x01\x00\x00"
+        for encrypt, decrypt in ((Helpers.AESEncrypt, Helpers.AESDecrypt), (Helpers.ChaCha20Encrypt, Helpers.ChaCha20Decrypt)):
+            this.assertEqual(decrypt(encrypt(b"payload", KEY, header), KEY, header), b"payload")
+
+
+if __name__ == "__main__":
+    unittest.main()
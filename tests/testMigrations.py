@@ -0,0 +1,55 @@
+"""Run from the repository root: python -m unittest discover -s tests"""
+import unittest
+from unittest import mock
+
+import aiosqlite
+
+from database.Migrations import Migration, MigrationError, Migrations
+
+
+class SqliteMigrationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(this) -> None:
+        this.conn = await aiosqlite.connect(":memory:")
+        # A database created before migration 2, when nothing kept aliases and uuids unique
+        await this.conn.execute("CREATE TABLE schema_version (version INTEGER PRIMARY KEY NOT NULL, appliedAt TEXT NOT NULL);")
+        await this.conn.execute("INSERT INTO schema_version (version, appliedAt) VALUES (1, datetime('now'))")
+        await this.conn.execute(Migrations.MIGRATIONS[0].sqlite[0])
+        await this.conn.executemany("INSERT INTO timezones (user, timezone, alias, uuid) VALUES (?, ?, ?, ?)", [
+            (3, "Europe/Prague", "dup", "uuid-a"),
+            (1, "Asia/Tokyo", "dup", "uuid-b"),
+            (2, "Europe/London", "dup", "uuid-a"),
+            (4, "Europe/Paris", "unique", None),
+            (5, "Europe/Berlin", None, None),
+        ])
+        await this.conn.commit()
+
+    async def asyncTearDown(this) -> None:
+        await this.conn.close()
+
+    async def testDuplicatesAreClearedBeforeIndexing(this) -> None:
+        this.assertEqual(await Migrations.migrateSqlite(this.conn), Migrations.LATEST_VERSION)
+
+        cursor = await this.conn.execute("SELECT user, alias, uuid FROM timezones ORDER BY user")
+        this.assertEqual(await cursor.fetchall(), [
+            (1, "dup", "uuid-b"),
+            (2, None, "uuid-a"),
+            (3, None, None),
+            (4, "unique", None),
+            (5, None, None),
+        ])
+
+        # The outbox migration ran too, so writes can be queued for replication
+        await this.conn.execute("SELECT COUNT(*) FROM replication_outbox")
+
+    async def testFailureRaises(this) -> None:
+        broken = (*Migrations.MIGRATIONS, Migration(Migrations.LATEST_VERSION + 1, "Broken", ("CREATE TABLE timezones (user INTEGER);",), ()))
+        with mock.patch.object(Migrations, "MIGRATIONS", broken), this.assertRaises(MigrationError):
+            await Migrations.migrateSqlite(this.conn)
+
+        # Everything before the broken migration stays applied
+        cursor = await this.conn.execute("SELECT MAX(version) FROM schema_version")
+        this.assertEqual((await cursor.fetchone())[0], Migrations.LATEST_VERSION)
+
+
+if __name__ == "__main__":
+    unittest.main()
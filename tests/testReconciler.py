@@ -0,0 +1,137 @@
+"""Run from the repository root: python -m unittest discover -s tests"""
+import asyncio
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+import aiosqlite
+
+from config.Config import DatabaseConfig
+from database.Migrations import Migrations
+from database.Reconciler import Reconciler, SqliteTimezoneStore
+from database.Replicator import MariaDBReplicator
+
+ROWS = [
+    (1001, "Europe/Prague", "kočka", "uuid-1"),
+    (2002, "Asia/Tokyo", "東京", None),
+    (3003, "America/New_York", None, "uuid-3"),
+    (4004, "Europe/London", "alias4", None),
+]
+
+
+class ReconcilerTest(unittest.IsolatedAsyncioTestCase):
+    """Reconciles two SQLite stores, standing in for SQLite and MariaDB."""
+
+    async def asyncSetUp(this) -> None:
+        directory = tempfile.TemporaryDirectory()
+        this.addCleanup(directory.cleanup)
+
+        this.source = await this.openStore(Path(directory.name) / "source.sqlite", ROWS)
+        this.replica = await this.openStore(Path(directory.name) / "replica.sqlite", ROWS)
+        this.reconciler = Reconciler(this.source, this.replica, 2)
+
+    async def asyncTearDown(this) -> None:
+        await this.source.close()
+        await this.replica.close()
+
+    async def openStore(this, path: Path, rows: list[tuple]) -> SqliteTimezoneStore:
+        async with aiosqlite.connect(path) as conn:
+            await Migrations.migrateSqlite(conn)
+            await conn.executemany("INSERT INTO timezones (user, timezone, alias, uuid) VALUES (?, ?, ?, ?)", rows)
+            await conn.commit()
+
+        store = SqliteTimezoneStore(path)
+        await store.open()
+        return store
+
+    async def rows(this, store: SqliteTimezoneStore) -> dict[int, tuple]:
+        return await store.fetchRange(0, 1 << 62)
+
+    async def testInSync(this) -> None:
+        result = await this.reconciler.reconcile()
+        this.assertGreater(result.chunks, 0)
+        this.assertEqual(result.differingChunks, 0)
+
+    async def testRepairsAndDeletes(this) -> None:
+        await this.replica.delete([2002])
+        await this.replica.upsert((3003, "Europe/Berlin", None, "uuid-3"))
+        # Holds the alias user 4004 has in the source, only a delete frees it
+        await this.replica.delete([4004])
+        await this.replica.upsert((5005, "Europe/Paris", "alias4", None))
+
+        sourceDigests = await this.source.chunkDigests(1001, 2000)
+        replicaDigests = await this.replica.chunkDigests(1001, 2000)
+        this.assertNotEqual(sourceDigests, replicaDigests)
+
+        result = await this.reconciler.reconcile()
+        this.assertGreater(result.differingChunks, 0)
+        this.assertEqual((result.upserted, result.deleted, result.conflicts), (3, 1, 0))
+        this.assertEqual(await this.rows(this.replica), await this.rows(this.source))
+
+        result = await this.reconciler.reconcile()
+        this.assertEqual(result.differingChunks, 0)
+
+    async def testEmptyStringDiffersFromNull(this) -> None:
+        await this.replica.upsert((3003, "America/New_York", "", "uuid-3"))
+        await this.replica.upsert((4004, "Europe/London", "alias4", ""))
+
+        result = await this.reconciler.reconcile()
+        this.assertEqual(result.upserted, 2)
+        this.assertEqual(await this.rows(this.replica), await this.rows(this.source))
+
+
+class ReplicationPauseTest(unittest.IsolatedAsyncioTestCase):
+    async def testReplicationWaitsForReconcile(this) -> None:
+        async def executeGetRowQuery(_query: str, _values: tuple) -> tuple[int, float]:
+            return 1, time.time()
+
+        database = SimpleNamespace(reconcileLock=asyncio.Lock(), executeGetRowQuery=executeGetRowQuery)
+        replicator = MariaDBReplicator(database, None, DatabaseConfig())
+        replicator.pool = object()
+        batches = 0
+
+        async def replicateBatch() -> None:
+            nonlocal batches
+            batches += 1
+            await asyncio.sleep(0.01)
+
+        replicator.replicateBatch = replicateBatch
+
+        async with database.reconcileLock:
+            replicator.start()
+            await asyncio.sleep(0.05)
+            this.assertEqual(batches, 0)
+
+        await asyncio.sleep(0.05)
+        replicator.task.cancel()
+        this.assertGreater(batches, 0)
+
+    async def testPoolOutlivesReconcile(this) -> None:
+        closed = []
+
+        class FakePool:
+            def close(this) -> None:
+                closed.append("close")
+
+            async def wait_closed(this) -> None:
+                closed.append("wait_closed")
+
+        database = SimpleNamespace(reconcileLock=asyncio.Lock())
+        replicator = MariaDBReplicator(database, None, DatabaseConfig())
+        pool = replicator.pool = FakePool()
+
+        async with database.reconcileLock:
+            drop = asyncio.create_task(replicator.dropPool())
+            await asyncio.sleep(0.01)
+            this.assertIs(replicator.pool, pool)
+            this.assertEqual(closed, [])
+
+        await drop
+        this.assertIsNone(replicator.pool)
+        this.assertEqual(closed, ["close", "wait_closed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Run from the repository root: python -m unittest discover -s tests"""
+import asyncio
+import json
+import unittest
+from types import SimpleNamespace
+
+from config.Config import ServerConfig
+from server.APIServer import APIServer
+from server.protocol.APIPayload import APIPayload, PacketFlags
+from server.protocol.TCP import TCPProtocol
+from server.RejectionTracker import RejectionReason
+from shared.GeoIP import GeoIPResolver
+
+
+def pingFrame(requestId: int | None = None) -> bytes:
+    content = b"{}"
+    headerLen = APIPayload.HEADER_LEN if requestId is None else APIPayload.SESSION_HEADER_LEN
+    flags = 0 if requestId is None else PacketFlags.SESSION
+    header = b"tz" + bytes([headerLen, 0, flags]) + len(content).to_bytes(2, "big")
+    if requestId is not None:
+        header += requestId.to_bytes(4, "big")
+    return header + content
+
+
+class FakeTransport:
+    def __init__(this) -> None:
+        this.written = bytearray()
+        this.closed = False
+
+    def get_extra_info(this, _name: str) -> tuple[str, int]:
+        return "127.0.0.1", 5000
+
+    def write(this, data: bytes) -> None:
+        this.written += data
+
+    def is_closing(this) -> bool:
+        return this.closed
+
+    def close(this) -> None:
+        this.closed = True
+
+    def pause_reading(this) -> None:
+        pass
+
+    def resume_reading(this) -> None:
+        pass
+
+
+class TCPFramingTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(this) -> None:
+        async def ignore(*_args: object) -> None:
+            pass
+
+        statsDb = SimpleNamespace(
+            addReceivedDataBandwidth=ignore, addProtocol=ignore, addEstablishedKnownRequestType=ignore, addFailedRequest=ignore,
+        )
+        tzBot = SimpleNamespace(
+            db=None,
+            config=SimpleNamespace(server=ServerConfig(0, "0" * 32, "1" * 32, 1, 1)),
+            statsDb=statsDb,
+            geoIp=GeoIPResolver(16),
+            API_PACKET_LOGGER=SimpleNamespace(sendLogEmbed=ignore),
+        )
+        this.server = APIServer(tzBot)
+        this.transport = FakeTransport()
+        this.protocol = TCPProtocol(this.server)
+        this.protocol.connection_made(this.transport)
+
+    async def asyncTearDown(this) -> None:
+        this.protocol.connection_lost(None)
+
+    def feed(this, data: bytes) -> None:
+        buffer = this.protocol.get_buffer(len(data))
+        buffer[:len(data)] = data
+        this.protocol.buffer_updated(len(data))
+
+    async def responses(this) -> list[tuple[int | None, dict]]:
+        await asyncio.gather(*this.protocol.pending)
+
+        responses = []
+        data = bytes(this.transport.written)
+        while data:
+            headerLen, contentLen = data[2], int.from_bytes(data[4:6], "big")
+            requestId = int.from_bytes(data[6:headerLen], "big") if data[3] & PacketFlags.SESSION else None
+            responses.append((requestId, json.loads(data[headerLen:headerLen + contentLen])))
+            data = data[headerLen + contentLen:]
+        return responses
+
+    async def testFrameSplitAcrossReads(this) -> None:
+        frame = pingFrame()
+        for chunk in (frame[:2], frame[2:6], frame[6:]):
+            this.assertEqual(this.protocol.pending, set())
+            this.feed(chunk)
+
+        this.assertEqual(await this.responses(), [(None, {"code": 200, "message": "Pong"})])
+        this.assertTrue(this.transport.closed)
+
+    async def testPipelinedSessionFrames(this) -> None:
+        this.feed(pingFrame(1) + pingFrame(2))
+
+        responses = await this.responses()
+        this.assertEqual(sorted(responses), [(1, {"code": 200, "message": "Pong"}), (2, {"code": 200, "message": "Pong"})])
+        this.assertFalse(this.transport.closed)
+
+    async def testBadFrameEndsSession(this) -> None:
+        this.feed(pingFrame(1) + b"XXXXXXX")
+
+        # The valid frame before it is still answered, the bad one is only counted
+        this.assertEqual(await this.responses(), [(1, {"code": 200, "message": "Pong"})])
+        this.assertTrue(this.transport.closed)
+        this.assertEqual(this.server.rejections.totals, {RejectionReason.BAD_MAGIC: 1})
+
+        this.feed(pingFrame(2))
+        this.assertEqual(this.protocol.pending, set())
+
+
+if __name__ == "__main__":
+    unittest.main()
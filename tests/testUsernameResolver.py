@@ -0,0 +1,122 @@
+"""Run from the repository root: python -m unittest discover -s tests"""
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+import discord
+
+from server.Api import ApiKey, ApiPermissions
+from server.ServerError import ErrorCode
+from server.protocol.APIPayload import PacketFlags
+from server.protocol.Client import Client
+from server.protocol.Response import Response
+from server.requests.Requests import IsLinkedRequest
+from shared.GeoIP import GeoIPResolver
+from shared.UsernameResolver import UsernameResolver
+
+UUID = "069a79f4-44e9-4726-a5be-fca90e38aaf5"
+
+
+class FakeDiscordClient:
+    """get_user answers from a gateway cache dict, fetch_user from a REST dict and counts its calls."""
+
+    def __init__(this, cached: dict[int, str] | None = None, remote: dict[int, str] | None = None) -> None:
+        this.cached = cached or {}
+        this.remote = remote or {}
+        this.fetches = 0
+
+    def get_user(this, userId: int) -> SimpleNamespace | None:
+        return SimpleNamespace(id=userId, name=this.cached[userId]) if userId in this.cached else None
+
+    async def fetch_user(this, userId: int) -> SimpleNamespace:
+        this.fetches += 1
+        await asyncio.sleep(0.01)
+        if userId not in this.remote:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown User")
+        return SimpleNamespace(id=userId, name=this.remote[userId])
+
+
+class RecordingClient(Client):
+    def __init__(this) -> None:
+        super().__init__(("127.0.0.1", 5000), b"0" * 32, PacketFlags.AESGCM, None)
+        this.responses = []
+
+    async def send(this, response: Response) -> None:
+        this.responses.append(response)
+
+
+class UsernameResolverTest(unittest.IsolatedAsyncioTestCase):
+    async def testGatewayHitSkipsFetch(this) -> None:
+        client = FakeDiscordClient(cached={1: "cached"}, remote={1: "remote"})
+        resolver = UsernameResolver(client, 16, 60)
+
+        this.assertEqual(await resolver.resolve(1), "cached")
+        this.assertEqual(client.fetches, 0)
+        this.assertEqual(resolver.gatewayHits, 1)
+
+    async def testConcurrentMissesAreCoalesced(this) -> None:
+        client = FakeDiscordClient(remote={2: "remote"})
+        resolver = UsernameResolver(client, 16, 60)
+
+        names = await asyncio.gather(*(resolver.resolve(2) for _ in range(10)))
+        this.assertEqual(names, ["remote"] * 10)
+        this.assertEqual(client.fetches, 1)
+
+        # Cached from now on
+        this.assertEqual(await resolver.resolve(2), "remote")
+        this.assertEqual(client.fetches, 1)
+
+    async def testInvalidateForcesRefetch(this) -> None:
+        client = FakeDiscordClient(remote={3: "old"})
+        resolver = UsernameResolver(client, 16, 60)
+        await resolver.resolve(3)
+
+        client.remote[3] = "new"
+        resolver.invalidate(3)
+        this.assertEqual(await resolver.resolve(3), "new")
+        this.assertEqual(client.fetches, 2)
+
+    async def testUnknownUserIsNone(this) -> None:
+        client = FakeDiscordClient()
+        resolver = UsernameResolver(client, 16, 60)
+
+        this.assertIsNone(await resolver.resolve(4))
+        this.assertIsNone(await resolver.resolve(4))
+        this.assertEqual(client.fetches, 2)
+
+
+class IsLinkedRequestTest(unittest.IsolatedAsyncioTestCase):
+    async def isLinked(this, discordClient: FakeDiscordClient, userId: int | None) -> list:
+        async def getUserIdByUUID(_uuid: str) -> int | None:
+            return userId
+
+        async def sendLogEmbed(_request: IsLinkedRequest) -> None:
+            pass
+
+        apiKey = ApiKey(1, ApiKey.permissionMask(ApiPermissions.MINECRAFT_UUID))
+        tzBot = SimpleNamespace(
+            db=SimpleNamespace(getUserIdByUUID=getUserIdByUUID),
+            apiDb=SimpleNamespace(getKey=lambda _key: apiKey),
+            usernames=UsernameResolver(discordClient, 16, 60),
+            geoIp=GeoIPResolver(16),
+            API_PACKET_LOGGER=SimpleNamespace(sendLogEmbed=sendLogEmbed),
+        )
+        client = RecordingClient()
+        await IsLinkedRequest(client, {"apiKey": "key"}, {"uuid": UUID}, tzBot).process()
+        return client.responses
+
+    async def testLinked(this) -> None:
+        responses = await this.isLinked(FakeDiscordClient(remote={5: "linked"}), 5)
+        this.assertEqual(responses, [ErrorCode.OK.withMessage("linked")])
+
+    async def testDeletedDiscordAccountIsNotFound(this) -> None:
+        responses = await this.isLinked(FakeDiscordClient(), 6)
+        this.assertEqual(responses, [ErrorCode.NOT_FOUND])
+
+    async def testUnlinkedIsNotFound(this) -> None:
+        responses = await this.isLinked(FakeDiscordClient(), None)
+        this.assertEqual(responses, [ErrorCode.NOT_FOUND])
+
+
+if __name__ == "__main__":
+    unittest.main()